@@ -12,12 +12,31 @@ from botocore.config import Config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Caching
+#
+# Cached API responses are invalidated by generation counters kept in the
+# cache itself (see icosa.helpers.cache). Web and task workers only see each
+# other's bumps when the cache is shared, so set DJANGO_CACHE_REDIS_URL in
+# production. Without it every process gets its own local memory cache, and
+# API responses are only cached for a few seconds.
+CACHE_REDIS_URL = os.environ.get("DJANGO_CACHE_REDIS_URL", None)
+SHARED_CACHE = False
 if os.environ.get("DJANGO_DISABLE_CACHE"):
     CACHES = {
         "default": {
             "BACKEND": "django.core.cache.backends.dummy.DummyCache",
         }
     }
+elif CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+    SHARED_CACHE = True
+API_CACHE_SECONDS = 300 if SHARED_CACHE else 10
 
 SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY")
 JWT_KEY = os.environ.get("JWT_SECRET_KEY")
@@ -95,6 +114,10 @@ if (
 else:
     DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
 
+# Client used to hide and unhide media files, see icosa.helpers.storage. Either
+# "b2", or "local" to hide files under MEDIA_ROOT instead.
+MEDIA_STORAGE_CLIENT = os.environ.get("DJANGO_MEDIA_STORAGE_CLIENT", "b2")
+
 STAFF_ONLY_ACCESS = os.environ.get("DJANGO_STAFF_ONLY_ACCESS")
 
 # Application definition
@@ -111,6 +134,7 @@ INSTALLED_APPS = [
     "django.contrib.sites",
     "django.contrib.staticfiles",
     "django.contrib.messages",
+    "django.contrib.postgres",
     "constance",
     "constance.backends.database",
     "icosa",
@@ -340,9 +364,27 @@ if DEBUG_TOOLBAR_ENABLED:
 HONEYPOT_FIELD_NAME = "asset_ref"
 
 # Huey settings
+#
+# Upload tasks run on their own named queues (see HUEY_QUEUES), each consumed
+# by a separate `run_huey_queue` process, so that a slow conversion doesn't
+# hold up finalizing other uploads. The default queue, consumed by
+# `run_huey`, runs periodic maintenance tasks.
+#
+# The SQLite backend keeps every queue in one local file. Use the Redis
+# backend when several app nodes need to share the queues. It needs Redis 5
+# or later for task priorities.
+
+HUEY_BACKEND = os.environ.get("DJANGO_HUEY_BACKEND", "sqlite")
+HUEY_REDIS_URL = os.environ.get("DJANGO_HUEY_REDIS_URL", "redis://redis:6379/1")
+
+HUEY_BACKEND_CLASSES = {
+    "sqlite": "huey.SqliteHuey",
+    "redis": "huey.PriorityRedisHuey",
+}
 
 HUEY = {
-    "huey_class": "huey.SqliteHuey",  # Huey implementation to use.
+    "huey_class": HUEY_BACKEND_CLASSES[HUEY_BACKEND],  # Huey implementation to use.
+    "connection": {"url": HUEY_REDIS_URL} if HUEY_BACKEND == "redis" else {},
     "results": True,  # Store return values of tasks.
     "store_none": False,  # If a task returns None, do not save to results.
     "immediate": False,
@@ -360,12 +402,71 @@ HUEY = {
     },
 }
 
+# Consumer options for each named queue, applied over HUEY["consumer"].
+
+HUEY_QUEUES = {
+    # Format uploads and finalize calls from Open Blocks. These must run one
+    # at a time, in the order they were queued, so that a finalize call sees
+    # every format uploaded before it and uploads for one asset don't race.
+    "uploads": {
+        "workers": 1,
+        "worker_type": "thread",
+        "periodic": False,
+    },
+    # Zip extraction and glTF conversion, which are CPU-heavy.
+    "conversions": {
+        "workers": int(os.environ.get("DJANGO_HUEY_CONVERSIONS_WORKERS", 2)),
+        "worker_type": "process",
+        "periodic": False,
+    },
+}
+
 # Note: Huey has its own setting to disable the task queue, but this still
 # calls the same code in userland. ENABLE_TASK_QUEUE is useful for excluding
 # huey from the code path entirely.
 
 ENABLE_TASK_QUEUE = os.environ.get("DJANGO_ENABLE_TASK_QUEUE", True)
 
+# Upload settings
+#
+# Limits on the contents of uploaded zip archives, to guard against zip bombs.
+# nginx already limits the size of the upload itself.
+
+UPLOAD_MAX_ZIP_MEMBERS = int(os.environ.get("DJANGO_UPLOAD_MAX_ZIP_MEMBERS", 1000))
+UPLOAD_MAX_UNCOMPRESSED_SIZE = int(
+    os.environ.get("DJANGO_UPLOAD_MAX_UNCOMPRESSED_SIZE", 2 * 1024 * 1024 * 1024)
+)
+
+# Where uploads wait for the upload tasks to process them. When the task queues
+# are shared between app nodes, this must be on a volume they all share.
+UPLOAD_STAGING_DIR = os.environ.get("DJANGO_UPLOAD_STAGING_DIR", "/tmp/icosa-uploads")
+
+# Number of long-lived node processes converting glTF 1 uploads to GLB in each
+# process that converts uploads, and how long one conversion may run. Each
+# conversions queue worker is a process running one task at a time, so one
+# converter each is enough; scale with DJANGO_HUEY_CONVERSIONS_WORKERS instead.
+GLTF_CONVERTER_WORKERS = int(os.environ.get("DJANGO_GLTF_CONVERTER_WORKERS", 1))
+GLTF_CONVERTER_TIMEOUT = int(os.environ.get("DJANGO_GLTF_CONVERTER_TIMEOUT", 300))
+
+# Rank settings
+#
+# Weights for the score used by `orderBy=BEST` and the landing pages. Ranks are
+# recomputed with these every hour, or with the `update_ranks` command.
+
+RANK_LIKES_WEIGHT = float(os.environ.get("DJANGO_RANK_LIKES_WEIGHT", 100))
+RANK_VIEWS_WEIGHT = float(os.environ.get("DJANGO_RANK_VIEWS_WEIGHT", 0.1))
+RANK_RECENCY_WEIGHT = float(os.environ.get("DJANGO_RANK_RECENCY_WEIGHT", 1))
+RANK_UPDATE_BATCH_SIZE = int(os.environ.get("DJANGO_RANK_UPDATE_BATCH_SIZE", 10000))
+
+# View counts
+#
+# When set, asset page views are counted in this Redis instance and written to
+# the database each minute by a periodic task, rather than updating the asset
+# row on every view. Enable persistence (e.g. appendonly) so that counts
+# survive a restart.
+
+VIEW_COUNTS_REDIS_URL = os.environ.get("DJANGO_VIEW_COUNTS_REDIS_URL", None)
+
 # Maintenance Mode settings
 
 MAINTENANCE_MODE = os.environ.get("DJANGO_MAINTENANCE_MODE", False)
@@ -383,6 +484,20 @@ MAINTENANCE_MODE_IGNORE_URLS = [
 
 NINJA_PAGINATION_PER_PAGE = 20
 
+# Cap the count used for `totalSize` in paginated API responses. Counting a
+# large filtered result set exactly can cost more than fetching the page, so
+# when set, totalSize is reported as at most this many items.
+API_PAGINATION_COUNT_LIMIT = int(os.environ.get("DJANGO_API_PAGINATION_COUNT_LIMIT", 0))
+
+# Search settings
+#
+# Dotted path to the SearchBackend used by the API's `keywords` filter and the
+# web search page. `icosa.helpers.search.IcontainsSearchBackend` restores the
+# old, unindexed substring matching.
+SEARCH_BACKEND = os.environ.get(
+    "DJANGO_SEARCH_BACKEND", "icosa.helpers.search.PostgresSearchBackend"
+)
+
 # Category settings
 #
 # Google Poly originally came with a set of categories that were not
@@ -15,8 +15,12 @@ echo "Running in $DEPLOYMENT_ENV mode"
 if [[ $DEPLOYMENT_ENV == 'production' ]];
 then
     python manage.py run_huey &
+    python manage.py run_huey_queue uploads &
+    python manage.py run_huey_queue conversions &
     gunicorn django_project.wsgi:application --bind 0.0.0.0:8000 --timeout 900
 else
     python manage.py run_huey &
+    python manage.py run_huey_queue uploads &
+    python manage.py run_huey_queue conversions &
     python manage.py runserver 0.0.0.0:8000
 fi
@@ -12,6 +12,7 @@ from icosa.models import (
     Oauth2Token,
     PolyFormat,
     PolyResource,
+    RankUpdateLog,
     Tag,
 )
 from import_export.admin import ExportActionMixin, ImportExportModelAdmin
@@ -157,11 +158,6 @@ class AssetAdmin(ImportExportModelAdmin, ExportActionMixin):
         "owner__displayname",
     )
 
-    def save_related(self, request, form, formsets, change):
-        super().save_related(request, form, formsets, change)
-        form.instance.update_search_text()
-        form.instance.save()
-
     filter_horizontal = ("tags",)
     inlines = (PolyFormatInline,)
     raw_id_fields = ["owner"]
@@ -278,6 +274,21 @@ class HiddenMediaFileLogAdmin(ImportExportModelAdmin, ExportActionMixin):
         return False
 
 
+@admin.register(RankUpdateLog)
+class RankUpdateLogAdmin(ImportExportModelAdmin, ExportActionMixin):
+    list_display = (
+        "start_time",
+        "duration",
+        "asset_count",
+    )
+    readonly_fields = (
+        "start_time",
+        "duration",
+        "asset_count",
+    )
+    date_hierarchy = "start_time"
+
+
 @admin.register(Oauth2Client)
 class Oauth2ClientAdmin(ImportExportModelAdmin, ExportActionMixin):
     pass
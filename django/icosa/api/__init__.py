@@ -1,8 +1,21 @@
+import base64
+import json
+import math
+from datetime import datetime
 from typing import Any, List, Optional
 
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Prefetch, Q
+from django.db.models.query import QuerySet
 from icosa.api.authentication import AuthBearer
 from icosa.api.exceptions import FilterException
+from icosa.models import (
+    API_DOWNLOAD_COMPATIBLE,
+    LISTING_DEFERRED_FIELDS,
+    Asset,
+    PolyFormat,
+    PolyResource,
+)
 from ninja import Schema
 from ninja.pagination import PaginationBase
 
@@ -15,12 +28,94 @@ POLY_CATEGORY_MAP = {
     "TECHNOLOGY": "TECH",
 }
 
+# Part of asset ETags. Bump this when AssetSchemaOut changes shape, so that
+# clients don't keep using responses in the old one.
+ASSET_SCHEMA_VERSION = 1
+
+# AssetSchemaOut includes presentationParams, so this one can't be deferred.
+API_DEFERRED_FIELDS = [
+    field for field in LISTING_DEFERRED_FIELDS if field != "presentation_params"
+]
+
 DEFAULT_PAGE_SIZE = 20
 DEFAULT_PAGE_TOKEN = 1
 MAX_PAGE_SIZE = 100
 
 
+# Orderings which can be paginated with a cursor instead of an offset. Each
+# must end with the primary key so that the sort key is unique. See
+# ORDERINGS in icosa.api.filters.
+KEYSET_ORDERINGS = [
+    ("-rank", "-id"),
+    ("-create_time", "-id"),
+    ("create_time", "id"),
+    ("-triangle_count", "-id"),
+    ("-liked_time", "-id"),
+]
+
+# Keyset fields holding datetimes, which cursors store as ISO strings.
+KEYSET_DATETIME_FIELDS = ["create_time", "liked_time"]
+
+
+def encode_cursor(ordering: tuple, obj) -> str:
+    field = ordering[0].lstrip("-")
+    value = getattr(obj, field)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    data = {"o": ordering[0], "k": [value, obj.pk]}
+    payload = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def parse_cursor_value(field: str, value):
+    if field in KEYSET_DATETIME_FIELDS:
+        if not isinstance(value, str):
+            raise TypeError("Expected an ISO datetime.")
+        return datetime.fromisoformat(value)
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError("Expected a finite number.")
+    return value
+
+
+def decode_cursor(token: str) -> Optional[dict]:
+    """Returns None for any token we didn't make, so that tampered or stale
+    cursors start from the first page."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        ordering = data["o"]
+        if ordering not in [keyset[0] for keyset in KEYSET_ORDERINGS]:
+            return None
+        value, pk = data["k"]
+        value = parse_cursor_value(ordering.lstrip("-"), value)
+        if not isinstance(pk, int):
+            return None
+    except (ValueError, TypeError, KeyError):
+        return None
+    return {"ordering": ordering, "value": value, "pk": pk}
+
+
+def get_keyset_q(ordering: tuple, cursor: dict) -> Q:
+    field = ordering[0].lstrip("-")
+    value = cursor["value"]
+    op = "lt" if ordering[0].startswith("-") else "gt"
+    after = Q(**{f"{field}__{op}": value})
+    after |= Q(**{field: value, f"pk__{op}": cursor["pk"]})
+    # Postgres can't seek an index on the OR alone, so bound it with a range
+    # the index can start from.
+    return Q(**{f"{field}__{op}e": value}) & after
+
+
 class AssetPagination(PaginationBase):
+    """Paginates by page number, or by cursor where the ordering allows it.
+
+    Numeric page tokens are still accepted for Poly API compatibility. When a
+    queryset is ordered by one of KEYSET_ORDERINGS, nextPageToken is an opaque
+    cursor encoding the last row's sort key and id, so that every page is an
+    index seek rather than an ever-growing OFFSET.
+    """
+
     class Input(Schema):
         pageToken: str = None
         page_token: str = None
@@ -34,11 +129,20 @@ class AssetPagination(PaginationBase):
 
     items_attribute: str = "assets"
 
+    def get_total_size(self, queryset) -> int:
+        if type(queryset) == list:
+            return len(queryset)
+        # On large result sets an exact count can cost more than the page
+        # itself. Optionally cap the count; totalSize is then a lower bound.
+        limit = getattr(settings, "API_PAGINATION_COUNT_LIMIT", None)
+        if limit:
+            return queryset.order_by()[:limit].count()
+        return queryset.count()
+
     def paginate_queryset(self, queryset, pagination: Input, request, **params):
         try:
             page_size = (
-                int(pagination.pageSize)
-                or int(pagination.page_size)
+                int(pagination.pageSize or pagination.page_size)
                 or DEFAULT_PAGE_SIZE
             )
         except (ValueError, TypeError):
@@ -46,27 +150,53 @@ class AssetPagination(PaginationBase):
             page_size = DEFAULT_PAGE_SIZE
         page_size = min(page_size, MAX_PAGE_SIZE)
 
+        token = pagination.pageToken or pagination.page_token or ""
+        cursor = None
         try:
-            page_token = (
-                int(pagination.pageToken)
-                or int(pagination.page_token)
-                or DEFAULT_PAGE_TOKEN
-            )
+            page_token = int(token) or DEFAULT_PAGE_TOKEN
         except (ValueError, TypeError):
-            # pageToken could still be defined, but empty: `?pageToken=`).
+            # pageToken could still be defined, but empty: `?pageToken=`), or
+            # could be a cursor.
             page_token = DEFAULT_PAGE_TOKEN
+            cursor = decode_cursor(token) if token else None
+
+        ordering = None
+        if type(queryset) != list:
+            order_by = tuple(queryset.query.order_by)
+            if order_by in KEYSET_ORDERINGS:
+                ordering = order_by
+        if cursor is not None and (
+            ordering is None or cursor["ordering"] != ordering[0]
+        ):
+            # A cursor from a different ordering is meaningless here; start
+            # from the beginning, as we do for other invalid tokens.
+            cursor = None
+
+        total_size = self.get_total_size(queryset)
+
+        if ordering is not None and page_token == DEFAULT_PAGE_TOKEN:
+            if cursor is not None:
+                queryset = queryset.filter(get_keyset_q(ordering, cursor))
+            # Fetch one extra row to find out if there is a next page.
+            items = list(queryset[: page_size + 1])
+            pagination_data = {
+                "assets": items[:page_size],
+                "totalSize": total_size,
+            }
+            if len(items) > page_size:
+                pagination_data.update(
+                    {
+                        "nextPageToken": encode_cursor(ordering, items[page_size - 1]),
+                    }
+                )
+            return pagination_data
 
         offset = (page_token - 1) * page_size
-        count = self._items_count(queryset)
-        if type(queryset) == list:
-            queryset_count = len(queryset)
-        else:
-            queryset_count = queryset.count()
         pagination_data = {
             "assets": queryset[offset : offset + page_size],
-            "totalSize": queryset_count,
+            "totalSize": total_size,
         }
-        if offset + page_size < count:
+        if offset + page_size < total_size:
             pagination_data.update(
                 {
                     "nextPageToken": str(page_token + 1),
@@ -110,3 +240,28 @@ def get_django_user_from_auth_bearer(request):
         return None
     token = header.replace("Bearer ", "")
     return AuthBearer().authenticate(request, token)
+
+
+def prefetch_asset_schema(assets: QuerySet[Asset]) -> QuerySet[Asset]:
+    """Load everything AssetSchemaOut needs in a fixed number of queries.
+
+    Owners are joined, while tags, download-compatible formats and their
+    resources are each fetched in one bulk query for the whole page. The
+    schema resolvers read `api_formats` and `api_resources` when present and
+    fall back to per-object queries otherwise. Columns the schema doesn't use
+    are left unloaded.
+    """
+    resources = PolyResource.objects.order_by("pk")
+    formats = PolyFormat.objects.filter(
+        role__in=API_DOWNLOAD_COMPATIBLE,
+    ).prefetch_related(
+        Prefetch("polyresource_set", queryset=resources, to_attr="api_resources"),
+    )
+    return (
+        assets.select_related("owner")
+        .defer(*API_DEFERRED_FIELDS)
+        .prefetch_related(
+            "tags",
+            Prefetch("polyformat_set", queryset=formats, to_attr="api_formats"),
+        )
+    )
@@ -1,3 +1,4 @@
+import hashlib
 import re
 import secrets
 from typing import List, NoReturn, Optional
@@ -5,27 +6,38 @@ from typing import List, NoReturn, Optional
 from django.conf import settings
 from django.core.files.storage import get_storage_class
 from django.db import transaction
-from django.db.models import Q
-from django.db.models.query import QuerySet
 from django.http import HttpRequest
 from django.urls import reverse
+from django.views.decorators.http import condition
 from icosa.api import (
+    ASSET_SCHEMA_VERSION,
     COMMON_ROUTER_SETTINGS,
-    POLY_CATEGORY_MAP,
     AssetPagination,
-    build_format_q,
     get_django_user_from_auth_bearer,
+    prefetch_asset_schema,
 )
 from icosa.api.authentication import AuthBearer
 from icosa.api.exceptions import FilterException
+from icosa.api.filters import filter_assets, get_order_by, sort_assets
+from icosa.helpers.cache import (
+    ASSET_LIST_GENERATION,
+    get_asset_generation,
+    get_generations,
+)
+from icosa.helpers.file import (
+    ZipLimitError,
+    check_upload_limits,
+    stage_upload_files,
+)
 from icosa.helpers.snowflake import generate_snowflake
-from icosa.models import ALL_RIGHTS_RESERVED, PUBLIC, Asset, AssetOwner
+from icosa.models import PRIVATE, Asset, AssetOwner
 from icosa.tasks import (
+    queue_delete_asset,
     queue_finalize_asset,
     queue_upload_asset,
     queue_upload_format,
 )
-from icosa.views.decorators import cache_per_user
+from icosa.views.decorators import cache_per_user, normalize_query
 from ninja import File, Query, Router
 from ninja.decorators import decorate_view
 from ninja.errors import HttpError
@@ -33,21 +45,18 @@ from ninja.files import UploadedFile
 from ninja.pagination import paginate
 
 from .schema import (
+    AssetDeleteStatusSchemaOut,
     AssetFilters,
     AssetFinalizeData,
     AssetSchemaOut,
     UploadJobSchemaOut,
-    filter_complexity,
-    filter_license,
-    filter_triangle_count,
-    get_keyword_q,
 )
 
 router = Router()
 
 default_storage = get_storage_class()()
 
-DEFAULT_CACHE_SECONDS = 10
+DEFAULT_CACHE_SECONDS = settings.API_CACHE_SECONDS
 
 IMAGE_REGEX = re.compile("(jpe?g|tiff?|png|webp|bmp)")
 
@@ -99,6 +108,68 @@ def check_user_owns_asset(
         raise HttpError(404, "Asset not found.")
 
 
+def asset_generations(request, asset: str, **kwargs) -> List[str]:
+    return [get_asset_generation(asset)]
+
+
+def user_asset_generations(request, asseturl: str, **kwargs) -> List[str]:
+    return [get_asset_generation(asseturl)]
+
+
+def asset_list_generations(request, **kwargs) -> List[str]:
+    return [ASSET_LIST_GENERATION]
+
+
+def get_asset_version(request, **lookup):
+    """Returns the id and update time of the matching asset, and its owner's
+    display name, or None if it's private, looking it up once per request."""
+    if not hasattr(request, "_asset_version"):
+        request._asset_version = (
+            Asset.objects.filter(**lookup)
+            .exclude(visibility=PRIVATE)
+            .values_list("pk", "update_time", "owner__displayname")
+            .first()
+        )
+    return request._asset_version
+
+
+def get_asset_etag(version) -> Optional[str]:
+    if version is None:
+        return None
+    # The response includes the owner's display name, which can change
+    # without touching the asset's update time.
+    pk, update_time, displayname = version
+    owner_hash = hashlib.md5((displayname or "").encode()).hexdigest()
+    return f"{pk}-{update_time.timestamp()}-{owner_hash}-{ASSET_SCHEMA_VERSION}"
+
+
+def asset_etag(request, asset: str, **kwargs) -> Optional[str]:
+    return get_asset_etag(get_asset_version(request, url=asset))
+
+
+def user_asset_etag(request, userurl: str, asseturl: str, **kwargs) -> Optional[str]:
+    return get_asset_etag(
+        get_asset_version(request, url=asseturl, owner__url=userurl)
+    )
+
+
+def asset_list_etag(request, **kwargs) -> str:
+    # Any change to a listed asset bumps the listing's generation, so this
+    # changes whenever the results of this query might have.
+    generation = get_generations([ASSET_LIST_GENERATION])[0]
+    key = f"{generation}:{normalize_query(request)}:{ASSET_SCHEMA_VERSION}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def check_files_within_limits(files: Optional[List[UploadedFile]]):
+    # The upload tasks run after we've responded, so oversized archives must
+    # be turned away here for the client to hear about it.
+    try:
+        check_upload_limits(files)
+    except ZipLimitError as err:
+        raise HttpError(413, f"{err}")
+
+
 def get_asset_by_id(
     request: HttpRequest,
     asset: int,
@@ -147,7 +218,8 @@ def get_my_id_asset(
     response=AssetSchemaOut,
     **COMMON_ROUTER_SETTINGS,
 )
-@decorate_view(cache_per_user(DEFAULT_CACHE_SECONDS))
+@decorate_view(cache_per_user(DEFAULT_CACHE_SECONDS, generations=asset_generations))
+@decorate_view(condition(etag_func=asset_etag))
 def get_asset(
     request,
     asset: str,
@@ -167,11 +239,31 @@ def delete_asset(
     asset = get_asset_by_url(request, asset)
     check_user_owns_asset(request, asset)
 
-    asset.hide_media()
-    asset.delete()
+    asset.mark_for_deletion()
+    if getattr(settings, "ENABLE_TASK_QUEUE", True) is True:
+        queue_delete_asset(asset_id=asset.pk)
+    else:
+        asset.hide_media()
+        asset.delete()
     return 204
 
 
+@router.get(
+    "/{str:asset}/delete_status",
+    auth=AuthBearer(),
+    response={200: AssetDeleteStatusSchemaOut},
+)
+def get_asset_delete_status(
+    request,
+    asset: str,
+):
+    """Reports on a deletion started with DELETE. Once it has finished, the
+    asset is gone and this returns 404."""
+    asset = get_asset_by_url(request, asset)
+    check_user_owns_asset(request, asset)
+    return {"state": asset.state}
+
+
 # This endpoint is for internal OpenBrush use for now. It's more complex than
 # it needs to  be until OpenBrush can send the formats data in a zip or some
 # other way.
@@ -194,11 +286,16 @@ def add_asset_format(
     check_user_owns_asset(request, asset)
 
     if request.headers.get("content-type").startswith("multipart/form-data"):
+        check_files_within_limits(files)
         print("***** REQUEST DEBUG START *****")
         try:
             print("FILES:")
             print(request.FILES)
-            queue_upload_format(user, asset, files)
+            queue_upload_format(
+                user_id=user.pk,
+                asset_id=asset.pk,
+                files=stage_upload_files(files),
+            )
         except HttpError:
             print("HEADERS:")
             print(request.headers)
@@ -253,7 +350,10 @@ def unpublish_asset(
     "/{str:userurl}/{str:asseturl}",
     response=AssetSchemaOut,
 )
-@decorate_view(cache_per_user(DEFAULT_CACHE_SECONDS))
+@decorate_view(
+    cache_per_user(DEFAULT_CACHE_SECONDS, generations=user_asset_generations)
+)
+@decorate_view(condition(etag_func=user_asset_etag))
 def get_user_asset(
     request,
     userurl: str,
@@ -287,6 +387,7 @@ def upload_new_assets(
     files: Optional[List[UploadedFile]] = File(None),
 ):
     user = AssetOwner.from_ninja_request(request)
+    check_files_within_limits(files)
     job_snowflake = generate_snowflake()
     asset_token = secrets.token_urlsafe(8)
     asset = Asset.objects.create(
@@ -297,68 +398,13 @@ def upload_new_assets(
     )
     if files is not None:
         queue_upload_asset(
-            user,
-            asset,
-            files,
+            user_id=user.pk,
+            asset_id=asset.pk,
+            files=stage_upload_files(files),
         )
     return get_publish_url(request, asset)
 
 
-def filter_assets(filters: AssetFilters) -> QuerySet[Asset]:
-    q = Q(
-        visibility=PUBLIC,
-        # imported=True,
-    )
-
-    if filters.tag:
-        q &= Q(tags__name__in=filters.tag)
-    if filters.category:
-        category_str = filters.category.upper()
-        category_str = POLY_CATEGORY_MAP.get(category_str, category_str)
-        q &= Q(category__iexact=category_str)
-    if filters.license:
-        q &= filter_license(filters.license)
-    if filters.curated:
-        q &= Q(curated=True)
-    if filters.name:
-        q &= Q(name__icontains=filters.name)
-    if filters.description:
-        q &= Q(description__icontains=filters.description)
-    author_name = filters.authorName or filters.author_name or None
-    if author_name is not None:
-        q &= Q(owner__displayname__icontains=author_name)
-    if filters.format:
-        q &= build_format_q(filters.format)
-    try:
-        keyword_q = get_keyword_q(filters)
-    except HttpError:
-        raise
-    q &= filter_complexity(filters)
-    q &= filter_triangle_count(filters)
-
-    ex_q = (
-        Q(license__isnull=True)
-        | Q(license=ALL_RIGHTS_RESERVED)
-        | Q(last_reported_time__isnull=False)
-    )
-
-    return Asset.objects.filter(q, keyword_q).exclude(ex_q).distinct()
-
-
-def sort_assets(key: str, assets: QuerySet[Asset]) -> QuerySet[Asset]:
-    if key == "NEWEST":
-        assets = assets.order_by("-create_time")
-    elif key == "OLDEST":
-        assets = assets.order_by("create_time")
-    elif key == "BEST":
-        assets = assets.order_by("-rank")
-    elif key == "TRIANGLECOUNT":
-        assets = assets.order_by("-triangle_count")
-    else:
-        pass
-    return assets
-
-
 @router.get(
     "",
     response=List[AssetSchemaOut],
@@ -373,7 +419,15 @@ def sort_assets(key: str, assets: QuerySet[Asset]) -> QuerySet[Asset]:
     url_name="asset_list",
 )
 @paginate(AssetPagination)
-@decorate_view(cache_per_user(DEFAULT_CACHE_SECONDS))
+@decorate_view(
+    # Listings only include public assets, so all users can share an entry.
+    cache_per_user(
+        DEFAULT_CACHE_SECONDS,
+        generations=asset_list_generations,
+        per_user=False,
+    )
+)
+@decorate_view(condition(etag_func=asset_list_etag))
 def get_assets(
     request,
     filters: AssetFilters = Query(...),
@@ -383,7 +437,6 @@ def get_assets(
     except FilterException as err:
         raise HttpError(400, f"{err}")
 
-    if filters.orderBy:
-        assets = sort_assets(filters.orderBy, assets)
+    assets = sort_assets(get_order_by(filters), assets)
 
-    return assets
+    return prefetch_asset_schema(assets)
@@ -0,0 +1,122 @@
+"""Builds asset listing querysets for both the API and the web views.
+
+Every listing is compiled into a single query: a Q for where the listing
+draws from, the filters in a FilterBase, and an ordering from ORDERINGS.
+Filters on many-valued relations use EXISTS subqueries rather than joins, so
+that results never need a DISTINCT.
+"""
+
+from typing import List, Optional
+
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.query import QuerySet
+from icosa.api import POLY_CATEGORY_MAP, build_format_q
+from icosa.api.schema import (
+    TagMatch,
+    filter_complexity,
+    filter_keywords,
+    filter_license,
+    filter_triangle_count,
+)
+from icosa.models import LISTED_Q, Asset
+
+# Each ordering ends with the primary key as a tiebreaker so that
+# AssetPagination can page through it with a cursor. See KEYSET_ORDERINGS.
+ORDERINGS = {
+    "NEWEST": ("-create_time", "-id"),
+    "OLDEST": ("create_time", "id"),
+    "BEST": ("-rank", "-id"),
+    "TRIANGLECOUNT": ("-triangle_count", "-id"),
+    # Only for querysets annotated with `liked_time`; see
+    # `get_me_likedassets` in icosa.api.users.
+    "LIKED_TIME": ("-liked_time", "-id"),
+}
+
+
+def filter_tags(names: List[str], match_all: bool = False) -> Q:
+    """Matches assets with any of the named tags, or with every one of them if
+    `match_all` is set."""
+    if match_all:
+        q = Q()
+        for name in set(names):
+            q &= filter_tags([name])
+        return q
+    tagged = Asset.tags.through.objects.filter(
+        asset=OuterRef("pk"),
+        tag__name__in=names,
+    )
+    return Q(Exists(tagged))
+
+
+def build_filter_q(filters) -> Q:
+    """Builds a Q from `filters`, a FilterBase. Keywords are left to
+    `filter_keywords`, as they depend on the search backend."""
+    q = Q()
+    if filters.tag:
+        q &= filter_tags(filters.tag, match_all=filters.tagMatch == TagMatch.ALL)
+    if filters.category:
+        category_str = filters.category.upper()
+        category_str = POLY_CATEGORY_MAP.get(category_str, category_str)
+        q &= Q(category=category_str)
+    license_str = getattr(filters, "license", None)
+    if license_str:
+        q &= filter_license(license_str)
+    if filters.curated:
+        q &= Q(curated=True)
+    if filters.name:
+        q &= Q(name__icontains=filters.name)
+    if filters.description:
+        q &= Q(description__icontains=filters.description)
+    author_name = (
+        getattr(filters, "authorName", None)
+        or getattr(filters, "author_name", None)
+        or None
+    )
+    if author_name is not None:
+        q &= Q(owner__displayname__icontains=author_name)
+    if filters.format:
+        q &= build_format_q(filters.format)
+    q &= filter_complexity(filters)
+    q &= filter_triangle_count(filters)
+    return q
+
+
+def get_order_by(filters) -> Optional[str]:
+    return filters.orderBy or filters.order_by
+
+
+def sort_assets(key: Optional[str], assets: QuerySet[Asset]) -> QuerySet[Asset]:
+    """Orders `assets` by one of ORDERINGS. Unknown keys leave them as they
+    are."""
+    ordering = ORDERINGS.get(key)
+    if ordering is None:
+        return assets
+    if key == "LIKED_TIME" and "liked_time" not in assets.query.annotations:
+        return assets
+    return assets.order_by(*ordering)
+
+
+def query_assets(
+    q: Q = LISTED_Q,
+    filters=None,
+    order_by: Optional[str] = None,
+    assets: Optional[QuerySet[Asset]] = None,
+) -> QuerySet[Asset]:
+    """Compiles a listing into one queryset. `q` chooses which assets the
+    listing draws from, and `filters` is an optional FilterBase narrowing
+    them. `assets` can be given to start from an annotated queryset.
+
+    Raises FilterException for filters we don't understand."""
+    if assets is None:
+        assets = Asset.objects.all()
+    if filters is not None:
+        q &= build_filter_q(filters)
+    assets = assets.filter(q)
+    if filters is not None:
+        assets = filter_keywords(assets, filters)
+    return sort_assets(order_by, assets)
+
+
+def filter_assets(filters) -> QuerySet[Asset]:
+    """The public API listing."""
+    return query_assets(LISTED_Q, filters)
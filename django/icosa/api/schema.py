@@ -2,12 +2,14 @@ from datetime import datetime
 from enum import Enum
 from typing import Annotated, List, Literal, Optional
 
+from icosa.helpers.search import get_search_backend
 from icosa.models import API_DOWNLOAD_COMPATIBLE, Asset
 from ninja import Field, ModelSchema, Schema
 from ninja.errors import HttpError
 from pydantic import EmailStr
 
 from django.db.models import Q
+from django.db.models.query import QuerySet
 from django.urls import reverse_lazy
 
 
@@ -70,10 +72,16 @@ class AssetFormat(Schema):
 
     @staticmethod
     def resolve_root(obj):
+        resources = getattr(obj, "api_resources", None)
+        if resources is not None:
+            return next((x for x in resources if x.is_root), None)
         return obj.polyresource_set.filter(is_root=True).first()
 
     @staticmethod
     def resolve_resources(obj):
+        resources = getattr(obj, "api_resources", None)
+        if resources is not None:
+            return [x for x in resources if not x.is_root]
         return obj.polyresource_set.filter(is_root=False)
 
     @staticmethod
@@ -139,6 +147,9 @@ class _DBAsset(ModelSchema):
 
     @staticmethod
     def resolve_formats(obj, context):
+        formats = getattr(obj, "api_formats", None)
+        if formats is not None:
+            return formats
         return [
             f
             for f in obj.polyformat_set.filter(
@@ -216,6 +227,10 @@ class UploadJobSchemaOut(Schema):
     assetId: str
 
 
+class AssetDeleteStatusSchemaOut(Schema):
+    state: str
+
+
 class OembedOut(Schema):
     type: Literal["rich"]
     version: Literal["1.0"]
@@ -258,6 +273,11 @@ class Complexity(Enum):
     SIMPLE = "SIMPLE"
 
 
+class TagMatch(Enum):
+    ANY = "ANY"
+    ALL = "ALL"
+
+
 class FilterBase(Schema):
     category: Optional[str] = None
     curated: bool = False
@@ -266,6 +286,7 @@ class FilterBase(Schema):
     name: Optional[str] = None
     description: Optional[str] = None
     tag: List[str] = Field(None, alias="tag")
+    tagMatch: Optional[TagMatch] = None
     orderBy: Optional[str] = None
     order_by: Optional[str] = None
     maxComplexity: Optional[Complexity] = None
@@ -341,8 +362,7 @@ def filter_triangle_count(filters) -> Q:
     return q
 
 
-def get_keyword_q(filters) -> Q:
-    q = Q()
+def filter_keywords(assets: QuerySet, filters) -> QuerySet:
     if filters.keywords:
         # The original API spec says "Multiple keywords should be separated
         # by spaces.". I believe this could be implemented better to allow
@@ -351,6 +371,5 @@ def get_keyword_q(filters) -> Q:
         keyword_list = filters.keywords.split(" ")
         if len(keyword_list) > 16:
             raise HttpError(400, "Exceeded 16 space-separated keywords.")
-        for keyword in keyword_list:
-            q &= Q(search_text__icontains=keyword)
-    return q
+        assets = get_search_backend().search(assets, filters.keywords)
+    return assets
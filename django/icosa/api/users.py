@@ -1,13 +1,10 @@
 from typing import List
 
-from django.db.models import Q
-from icosa.api import (
-    COMMON_ROUTER_SETTINGS,
-    POLY_CATEGORY_MAP,
-    AssetPagination,
-    build_format_q,
-)
-from icosa.models import PRIVATE, PUBLIC, UNLISTED, Asset, AssetOwner, Tag
+from django.db.models import F, Q
+from icosa.api import COMMON_ROUTER_SETTINGS, AssetPagination, prefetch_asset_schema
+from icosa.api.exceptions import FilterException
+from icosa.api.filters import get_order_by, query_assets
+from icosa.models import PRIVATE, PUBLIC, UNLISTED, Asset, AssetOwner
 from ninja import Query, Router
 from ninja.errors import HttpError
 from ninja.pagination import paginate
@@ -19,10 +16,6 @@ from .schema import (
     FullUserSchema,
     PatchUserSchema,
     UserAssetFilters,
-    filter_complexity,
-    filter_license,
-    filter_triangle_count,
-    get_keyword_q,
 )
 
 router = Router()
@@ -78,7 +71,6 @@ def get_me_assets(
     q = Q(
         owner=owner,
     )
-    ex_q = Q()
     if filters.visibility:
         if filters.visibility in [
             PRIVATE,
@@ -95,36 +87,11 @@ def get_me_assets(
                 "Unknown visibility specifier. Expected one of UNSPECIFIED, PUBLISHED, PRIVATE, UNLISTED.",  # TODO: brittle
             )
 
-    if filters.format:
-        q &= build_format_q(filters.format)
-
-    if filters.tag:
-        tags = Tag.objects.filter(name__in=filters.tag)
-        q &= Q(tags__in=tags)
-    if filters.category:
-        category_str = filters.category.upper()
-        category_str = POLY_CATEGORY_MAP.get(category_str, category_str)
-        q &= Q(category__iexact=category_str)
-    if filters.curated:
-        q &= Q(curated=True)
-    if filters.name:
-        q &= Q(name__icontains=filters.name)
-    if filters.description:
-        q &= Q(description__icontains=filters.description)
     try:
-        keyword_q = get_keyword_q(filters)
-    except HttpError:
-        raise
-    # TODO: orderBy
-    assets = (
-        Asset.objects.filter(q, keyword_q)
-        .exclude(ex_q)
-        .distinct()
-        .select_related("owner")
-        .prefetch_related("polyformat_set")
-        .prefetch_related("tags")
-    )
-    return assets
+        assets = query_assets(q, filters, get_order_by(filters))
+    except FilterException as err:
+        raise HttpError(400, f"{err}")
+    return prefetch_asset_schema(assets)
 
 
 @router.get(
@@ -139,66 +106,24 @@ def get_me_likedassets(
     filters: AssetFilters = Query(...),
 ):
     owner = AssetOwner.from_ninja_request(request)
-    liked_assets = owner.likedassets.all()
     q = Q(
         visibility__in=[PUBLIC, UNLISTED],
     )
     q |= Q(visibility__in=[PRIVATE, UNLISTED], owner=owner)
 
-    if filters.format:
-        q &= build_format_q(filters.format)
-
-    if filters.orderBy and filters.orderBy == "LIKED_TIME":
-        liked_assets = liked_assets.order_by("-date_liked")
-
-    # Get the ordered IDs for sorting later, if we need to. We can't use
-    # `owner.likes.all` because we need the timestamp of when the asset was
-    # liked.
-    liked_ids = list(liked_assets.values_list("asset__pk", flat=True))
-    q &= Q(pk__in=liked_ids)
-
-    if filters.tag:
-        tags = Tag.objects.filter(name__in=filters.tag)
-        q &= Q(tags__in=tags)
-    if filters.category:
-        category_str = filters.category.upper()
-        category_str = POLY_CATEGORY_MAP.get(category_str, category_str)
-        q &= Q(category__iexact=category_str)
-    if filters.license:
-        q &= filter_license(filters.license)
-    q &= filter_complexity(filters)
-    q &= filter_triangle_count(filters)
-    if filters.curated:
-        q &= Q(curated=True)
-    if filters.name:
-        q &= Q(name__icontains=filters.name)
-    if filters.description:
-        q &= Q(description__icontains=filters.description)
-    author_name = filters.authorName or filters.author_name or None
-    if author_name is not None:
-        q &= Q(owner__displayname__icontains=author_name)
-    # TODO: orderBy
+    # Join through the likes, so that the time each asset was liked can be
+    # sorted on in the database. Each asset is liked at most once per owner,
+    # as likes are added through `AssetOwner.likes`.
+    liked_assets = Asset.objects.filter(ownerassetlike__user=owner).annotate(
+        liked_time=F("ownerassetlike__date_liked")
+    )
     try:
-        keyword_q = get_keyword_q(filters)
-        q &= keyword_q
-    except HttpError:
-        raise
-
-    assets = Asset.objects.filter(q)
-
-    if filters.orderBy:
-        if filters.orderBy == "LIKED_TIME":
-            # Sort the assets by order of liked ID. Slow, but
-            # database-agnostic. Postgres and MySql have different ways to do
-            # this, and we'd need to use the `extra` params in our query, which
-            # are database-specific.
-            assets = sorted(assets, key=lambda i: liked_ids.index(i.pk))
-        elif filters.orderBy == "NEWEST":
-            assets = assets.order_by("-create_time")
-        elif filters.orderBy == "OLDEST":
-            assets = assets.order_by("create_time")
-        elif filters.orderBy == "BEST":
-            assets = assets.order_by("-rank")
-        else:
-            pass
-    return assets
+        assets = query_assets(
+            q,
+            filters,
+            get_order_by(filters),
+            assets=liked_assets,
+        )
+    except FilterException as err:
+        raise HttpError(400, f"{err}")
+    return prefetch_asset_schema(assets)
@@ -0,0 +1,83 @@
+import time
+from typing import List
+
+from django.core.cache import cache
+
+# Cached views include generation counters in their keys. Bumping a counter
+# makes every entry built with its old value unreachable, so that changes show
+# up straight away rather than when the entry expires.
+ASSET_LIST_GENERATION = "asset_list"
+
+CACHE_STATS_KEYS = {
+    "hits": "cache_stats:hits",
+    "misses": "cache_stats:misses",
+}
+
+# Query parameters which the API accepts under two names. Only these may be
+# folded together in cache keys: other snake_case spellings are ignored by
+# the API, so they must not share an entry with the names that are used.
+PARAM_ALIASES = {
+    "page_token": "pageToken",
+    "page_size": "pageSize",
+    "order_by": "orderBy",
+    "author_name": "authorName",
+}
+
+
+def get_asset_generation(asset_url: str) -> str:
+    return f"asset:{asset_url}"
+
+
+def generation_key(name: str) -> str:
+    return f"generation:{name}"
+
+
+def get_generations(names: List[str]) -> List[int]:
+    keys = [generation_key(name) for name in names]
+    generations = cache.get_many(keys)
+    # A counter starts at the current time rather than zero, so that one which
+    # has been evicted can't come back to a value it had before.
+    missing = {key: time.time_ns() for key in keys if key not in generations}
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(*names: str):
+    for name in names:
+        key = generation_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_asset_generations(*asset_urls: str):
+    bump_generations(
+        *[get_asset_generation(asset_url) for asset_url in asset_urls],
+        ASSET_LIST_GENERATION,
+    )
+
+
+def normalize_param_name(name: str) -> str:
+    """Folds the snake_case spelling of a parameter in PARAM_ALIASES into its
+    camelCase one, so that `pageToken` and `page_token` share a cache entry."""
+    return PARAM_ALIASES.get(name, name)
+
+
+def record_cache_result(hit: bool):
+    key = CACHE_STATS_KEYS["hits" if hit else "misses"]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_cache_stats() -> dict:
+    values = cache.get_many(CACHE_STATS_KEYS.values())
+    return {name: values.get(key, 0) for name, key in CACHE_STATS_KEYS.items()}
+
+
+def reset_cache_stats():
+    cache.delete_many(CACHE_STATS_KEYS.values())
@@ -2,16 +2,17 @@ import base64
 import io
 import os
 import re
-import subprocess
+import tempfile
 import zipfile
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 
-import ijson
 from django.conf import settings
 from django.core.files.storage import get_storage_class
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import transaction
 from icosa.helpers.format_roles import (
     BLOCKS_FORMAT,
     ORIGINAL_FBX_FORMAT,
@@ -20,12 +21,15 @@ from icosa.helpers.format_roles import (
     ORIGINAL_TRIANGULATED_OBJ_FORMAT,
     TILT_FORMAT,
 )
+from icosa.helpers.gltf import GltfError, GltfInfo, inspect_gltf
+from icosa.helpers.gltf_converter import ConversionError, convert_gltf_to_glb
 from icosa.models import (
     ASSET_STATE_COMPLETE,
     Asset,
     AssetOwner,
     PolyFormat,
     PolyResource,
+    update_format_denorms,
 )
 from ninja import File
 from ninja.errors import HttpError
@@ -34,11 +38,13 @@ from PIL import Image
 
 default_storage = get_storage_class()()
 
-CONVERTER_EXE = "/node_modules/gltf-pipeline/bin/gltf-pipeline.js"
-
-
 ASSET_NOT_FOUND = HttpError(404, "Asset not found.")
 
+# An uploaded file copied into settings.UPLOAD_STAGING_DIR for a task to pick
+# up, as (name, path). Tasks take these rather than the files themselves so
+# that upload bytes stay out of the queue.
+StagedFile = Tuple[str, str]
+
 IMAGE_REGEX = re.compile("(jpe?g|tiff?|png|webp|bmp)")
 
 VALID_FORMAT_TYPES = [
@@ -69,6 +75,13 @@ CONTENT_TYPE_MAP = {
 }
 
 
+# Zip members up to this size are kept in memory while they are processed.
+# Larger ones, and any beyond UPLOAD_MEMORY_BUDGET, are spooled to disk.
+UPLOAD_SPOOL_MAX_SIZE = 1024 * 1024
+UPLOAD_MEMORY_BUDGET = 32 * 1024 * 1024
+COPY_CHUNK_SIZE = 64 * 1024
+
+
 def get_content_type(filename):
     extension = os.path.splitext(filename)[-1].replace(".", "")
     return CONTENT_TYPE_MAP.get(extension, None)
@@ -85,16 +98,14 @@ class UploadedFormat:
     extension: str
     filetype: str
     mainfile: bool
+    gltf: Optional[GltfInfo] = None
 
 
 def is_gltf2(file) -> bool:
-    parser = ijson.parse(file, multiple_values=True)
-    for prefix, event, value in parser:
-        if (value, event) == ("buffers", "map_key"):
-            # We are mapping a dictionary at the key `buffers`, which means
-            # this is gltf1.
-            return False
-    return True
+    try:
+        return inspect_gltf(file).version == 2
+    except GltfError:
+        return True
 
 
 def validate_file(file: UploadedFile, extension: str) -> Optional[UploadedFormat]:
@@ -109,6 +120,7 @@ def validate_file(file: UploadedFile, extension: str) -> Optional[UploadedFormat
 
     filetype = None
     mainfile = False
+    gltf = None
 
     if extension == "tilt":
         filetype = "TILT"
@@ -119,11 +131,16 @@ def validate_file(file: UploadedFile, extension: str) -> Optional[UploadedFormat
         mainfile = True
 
     # GLTF/GLB/BIN
+    if extension in ["glb", "gltf"]:
+        try:
+            gltf = inspect_gltf(file.file)
+        except GltfError as err:
+            print(f"Failed to inspect {file.name}: {err}")
     if extension == "glb":
         filetype = "GLTF2"
         mainfile = True
     if extension == "gltf":
-        if is_gltf2(file.file):
+        if gltf is None or gltf.version == 2:
             filetype = "GLTF2"
         else:
             filetype = "GLTF"
@@ -154,10 +171,161 @@ def validate_file(file: UploadedFile, extension: str) -> Optional[UploadedFormat
         extension,
         filetype,
         mainfile,
+        gltf,
     )
 
 
-def process_main_file(mainfile, sub_files, asset, gltf_to_convert):
+class ZipLimitError(Exception):
+    pass
+
+
+def check_zip_limits(file: UploadedFile):
+    """Checks an uploaded zip against the settings' limits using the sizes in
+    its directory, so that uploads can be rejected before they are queued.
+    Raises ZipLimitError. `extract_zip` checks the sizes again as it reads, in
+    case the directory lies."""
+    max_members = settings.UPLOAD_MAX_ZIP_MEMBERS
+    max_size = settings.UPLOAD_MAX_UNCOMPRESSED_SIZE
+    try:
+        with zipfile.ZipFile(file) as zip_file:
+            members = [x for x in zip_file.infolist() if not x.is_dir()]
+    except zipfile.BadZipFile:
+        # Left for the upload task to fail on, as before.
+        return
+    finally:
+        file.seek(0)
+    if len(members) > max_members:
+        raise ZipLimitError(f"Zip archive has more than {max_members} files.")
+    if sum(x.file_size for x in members) > max_size:
+        raise ZipLimitError("Zip archive is too large when uncompressed.")
+
+
+def check_upload_limits(files: Optional[List[UploadedFile]]):
+    """Raises ZipLimitError if any uploaded zip is over the limits."""
+    for file in files or []:
+        if file.name.endswith(".zip"):
+            check_zip_limits(file)
+
+
+def extract_zip(file: UploadedFile) -> List[UploadedFile]:
+    """Extracts each member of an uploaded zip into its own temporary file,
+    copying in chunks so that memory use doesn't grow with the archive.
+
+    Raises ZipLimitError if the archive has more members, or more uncompressed
+    data, than settings allow. Sizes are counted as they are read rather than
+    trusted from the archive's headers.
+    """
+    max_members = settings.UPLOAD_MAX_ZIP_MEMBERS
+    max_size = settings.UPLOAD_MAX_UNCOMPRESSED_SIZE
+    extracted = []
+    total_size = 0
+    memory_used = 0
+    with zipfile.ZipFile(file) as zip_file:
+        members = [x for x in zip_file.infolist() if not x.is_dir()]
+        if len(members) > max_members:
+            raise ZipLimitError(f"Zip archive has more than {max_members} files.")
+        for zip_info in members:
+            if memory_used + UPLOAD_SPOOL_MAX_SIZE <= UPLOAD_MEMORY_BUDGET:
+                out = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE)
+                memory_used += UPLOAD_SPOOL_MAX_SIZE
+            else:
+                out = tempfile.TemporaryFile()
+            member_size = 0
+            with zip_file.open(zip_info) as extracted_file:
+                while chunk := extracted_file.read(COPY_CHUNK_SIZE):
+                    member_size += len(chunk)
+                    if total_size + member_size > max_size:
+                        out.close()
+                        for x in extracted:
+                            x.close()
+                        raise ZipLimitError(
+                            "Zip archive is too large when uncompressed."
+                        )
+                    out.write(chunk)
+            total_size += member_size
+            out.seek(0)
+            extracted.append(
+                UploadedFile(name=zip_info.filename, file=out, size=member_size)
+            )
+    return extracted
+
+
+def stage_upload_files(
+    files: Optional[List[UploadedFile]],
+) -> Optional[List[StagedFile]]:
+    if files is None:
+        return None
+    Path(settings.UPLOAD_STAGING_DIR).mkdir(parents=True, exist_ok=True)
+    staged = []
+    for file in files:
+        fd, path = tempfile.mkstemp(dir=settings.UPLOAD_STAGING_DIR)
+        with os.fdopen(fd, "wb") as out:
+            for chunk in file.chunks():
+                out.write(chunk)
+        staged.append((file.name, path))
+    return staged
+
+
+@contextmanager
+def open_staged_files(
+    staged: Optional[List[StagedFile]],
+) -> Iterator[Optional[List[UploadedFile]]]:
+    """Opens staged files as uploads, then closes and deletes them on exit."""
+    if staged is None:
+        yield None
+        return
+    files = []
+    try:
+        for name, path in staged:
+            files.append(
+                UploadedFile(
+                    name=name, file=open(path, "rb"), size=os.path.getsize(path)
+                )
+            )
+        yield files
+    finally:
+        for file in files:
+            file.close()
+        for name, path in staged:
+            Path.unlink(path, missing_ok=True)
+
+
+class FormatGraph:
+    """Collects the formats and resources for an upload in memory, so that
+    they can be saved with one insert per model."""
+
+    def __init__(self, asset: Asset):
+        self.asset = asset
+        self.formats = []
+        self.resources = []
+        # Files which must stay open until their resources are saved.
+        self.open_files = []
+
+    def add_format(self, **kwargs) -> PolyFormat:
+        format = PolyFormat(asset=self.asset, **kwargs)
+        self.formats.append(format)
+        return format
+
+    def add_resource(self, **kwargs) -> PolyResource:
+        resource = PolyResource(asset=self.asset, **kwargs)
+        self.resources.append(resource)
+        return resource
+
+    def save(self):
+        try:
+            with transaction.atomic():
+                PolyFormat.objects.bulk_create(self.formats)
+                PolyResource.objects.bulk_create(self.resources)
+                # Bulk inserts don't send the signals which keep the asset's
+                # format denorms up to date.
+                if self.formats or self.resources:
+                    update_format_denorms(self.asset.pk, self.asset)
+        finally:
+            for file in self.open_files:
+                file.close()
+
+
+def process_main_file(mainfile, sub_files, asset, gltf_to_convert, graph):
     is_first_format = True
     # Main files determine folder
     format_type = mainfile.filetype
@@ -174,28 +342,33 @@ def process_main_file(mainfile, sub_files, asset, gltf_to_convert):
     ):
         format_type = "GLB"
         name = f"{os.path.splitext(name)[0]}.glb"
-        with open(gltf_to_convert, "rb") as f:
-            file = UploadedFile(
-                name=name,
-                file=io.BytesIO(f.read()),
-            )
+        # Storage reads this in chunks, so there's no need to load it first.
+        converted_file = open(gltf_to_convert, "rb")
+        graph.open_files.append(converted_file)
+        file = UploadedFile(
+            name=name,
+            file=converted_file,
+            size=os.path.getsize(gltf_to_convert),
+        )
 
     format_data = {
         "format_type": format_type,
-        "asset": asset,
     }
-    format = PolyFormat.objects.create(**format_data)
+    if mainfile.gltf is not None:
+        # Conversion doesn't change the geometry, so the count from the
+        # uploaded file holds for the converted one too.
+        format_data["triangle_count"] = mainfile.gltf.triangle_count
+    format = graph.add_format(**format_data)
     if is_first_format:
         is_first_format = False
 
     resource_data = {
         "file": file,
         "is_root": True,
-        "asset": asset,
         "format": format,
         "contenttype": get_content_type(name),
     }
-    PolyResource.objects.create(**resource_data)
+    graph.add_resource(**resource_data)
 
     for subfile in sub_files:
         # Horrendous check for supposedly compatible subfiles. can
@@ -218,10 +391,9 @@ def process_main_file(mainfile, sub_files, asset, gltf_to_convert):
                 "file": subfile.file,
                 "format": format,
                 "is_root": False,
-                "asset": asset,
                 "contenttype": get_content_type(subfile.file.name),
             }
-            PolyResource.objects.create(**sub_resource_data)
+            graph.add_resource(**sub_resource_data)
 
 
 def add_thumbnail_to_asset(thumbnail, asset):
@@ -276,60 +448,53 @@ def get_gltf(asset: Asset) -> Optional[PolyResource]:
     return asset.polyresource_set.filter(is_root=True, format__role=12).first()
 
 
-def process_normally(asset: Asset, f: UploadedFormat):
+def process_normally(graph: FormatGraph, f: UploadedFormat):
     format_data = {
         "format_type": f.filetype,
-        "asset": asset,
+        "role": get_role_id(f),
     }
-    format = PolyFormat.objects.create(**format_data)
+    format = graph.add_format(**format_data)
     resource_data = {
         "file": f.file,
         "format": format,
         "is_root": f.mainfile,
-        "asset": asset,
         "contenttype": get_content_type(f.file.name),
     }
-    resource_role = get_role_id(f)
-    if resource_role is not None:
-        format.role = resource_role
-        format.save()
-
-    PolyResource.objects.create(**resource_data)
+    graph.add_resource(**resource_data)
 
 
-def process_mtl(asset: Asset, f: UploadedFormat):
+def process_mtl(graph: FormatGraph, f: UploadedFormat):
     # Get or create both OBJ root resources that correspond to this MTL
     # along with the parent format.
+    asset = graph.asset
     obj_non_triangulated = get_obj_non_triangulated(asset)
     obj_triangulated = get_obj_triangulated(asset)
 
     format_data = {
         "format_type": "OBJ",
-        "asset": asset,
     }
     resource_data = {
         "file": None,
         "is_root": True,
-        "asset": asset,
         "contenttype": "text/plain",
     }
     if obj_non_triangulated is None:
-        format_non_triangulated = PolyFormat.objects.create(
+        format_non_triangulated = graph.add_format(
             **format_data,
             role=1,
         )
-        obj_non_triangulated = PolyResource.objects.create(
+        obj_non_triangulated = graph.add_resource(
             format=format_non_triangulated, **resource_data
         )
     else:
         format_non_triangulated = obj_non_triangulated.format
 
     if obj_triangulated is None:
-        format_triangulated = PolyFormat.objects.create(
+        format_triangulated = graph.add_format(
             **format_data,
             role=24,
         )
-        obj_triangulated = PolyResource.objects.create(
+        obj_triangulated = graph.add_resource(
             format=format_triangulated, **resource_data
         )
     else:
@@ -339,17 +504,16 @@ def process_mtl(asset: Asset, f: UploadedFormat):
     resource_data = {
         "file": f.file,
         "is_root": False,
-        "asset": asset,
         "contenttype": get_content_type(f.file.name),
     }
-    PolyResource.objects.create(format=format_non_triangulated, **resource_data)
-    PolyResource.objects.create(format=format_triangulated, **resource_data)
+    graph.add_resource(format=format_non_triangulated, **resource_data)
+    graph.add_resource(format=format_triangulated, **resource_data)
 
 
-def process_bin(asset: Asset, f: UploadedFormat):
+def process_bin(graph: FormatGraph, f: UploadedFormat):
     # Get or create a GLTF root resource that correspond to this BIN along with
     # the parent format.
-    gltf = get_gltf(asset)
+    gltf = get_gltf(graph.asset)
 
     if gltf is None:
         if is_gltf2(f.file):
@@ -358,35 +522,32 @@ def process_bin(asset: Asset, f: UploadedFormat):
             format_type = "GLTF"
         format_data = {
             "format_type": format_type,
-            "asset": asset,
         }
-        format = PolyFormat.objects.create(**format_data, role=12)
+        format = graph.add_format(**format_data, role=12)
         resource_data = {
             "file": None,
             "is_root": True,
-            "asset": asset,
             "contenttype": "application/gltf+json",
         }
-        gltf = PolyResource.objects.create(format=format, **resource_data)
+        gltf = graph.add_resource(format=format, **resource_data)
     else:
         format = gltf.format
     # Finally, create the duplicate BIN resource and assign it to the format.
     resource_data = {
         "file": f.file,
         "is_root": False,
-        "asset": asset,
         "format": format,
         "contenttype": get_content_type(f.file.name),
     }
-    PolyResource.objects.create(**resource_data)
+    graph.add_resource(**resource_data)
 
 
-def process_root(asset: Asset, f: UploadedFormat):
-    root = asset.polyresource_set.filter(
+def process_root(graph: FormatGraph, f: UploadedFormat):
+    root = graph.asset.polyresource_set.filter(
         is_root=True, format__role=get_role_id(f), file=""
     ).first()
     if root is None:
-        process_normally(asset, f)
+        process_normally(graph, f)
     else:
         root.file = f.file
         root.save()
@@ -412,15 +573,16 @@ def upload_format(
         format__role=get_role_id(f), file__endswith=f.file.name
     ).first()
 
+    graph = FormatGraph(asset)
     if existing_resource is not None:
         existing_resource.file = f.file
         existing_resource.save()
     elif filetype == "MTL":
-        process_mtl(asset, f)
+        process_mtl(graph, f)
     elif filetype == "BIN":
-        process_bin(asset, f)
+        process_bin(graph, f)
     elif filetype in ["OBJ", "GLTF2", "GLTF"]:
-        process_root(asset, f)
+        process_root(graph, f)
     elif filetype == "IMAGE" and f.file.name == "thumbnail.png":
         asset.thumbnail = f.file
         asset.thumbnail_contenttype = get_content_type(f.file.name)
@@ -428,7 +590,8 @@ def upload_format(
         # but might reduce perf.
         asset.save()
     else:
-        process_normally(asset, f)
+        process_normally(graph, f)
+    graph.save()
 
     return asset
 
@@ -457,27 +620,13 @@ def upload_asset(
         ]:
             thumbnail = file
         elif file.name.endswith(".zip"):
-            # Read the file as a ZIP file
-            with zipfile.ZipFile(io.BytesIO(file.read())) as zip_file:
-                # Iterate over each file in the ZIP
-                for zip_info in zip_file.infolist():
-                    # Skip directories
-                    if zip_info.is_dir():
-                        continue
-                    # Read the file contents
-                    with zip_file.open(zip_info) as extracted_file:
-                        # Create a new UploadedFile object
-                        content = extracted_file.read()
-                        processed_file = UploadedFile(
-                            name=zip_info.filename,
-                            file=io.BytesIO(content),
-                        )
-                        unzipped_files.append(processed_file)
-                        if thumbnail is None and zip_info.filename.lower() in [
-                            "thumbnail.png",
-                            "thumbnail.jpg",
-                        ]:
-                            thumbnail = processed_file
+            for processed_file in extract_zip(file):
+                unzipped_files.append(processed_file)
+                if thumbnail is None and processed_file.name.lower() in [
+                    "thumbnail.png",
+                    "thumbnail.jpg",
+                ]:
+                    thumbnail = processed_file
         else:
             unzipped_files.append(file)
 
@@ -520,23 +669,11 @@ def upload_asset(
         Path(os.path.join(asset_dir, "converted")).mkdir(parents=True, exist_ok=True)
         name, extension = os.path.splitext(gltf_to_convert[1])
         out_path = os.path.join(asset_dir, "converted", f"{name}.glb")
-        data = Path(gltf_to_convert[0]).read_text()
-        shader_dummy_path = os.path.join(settings.STATIC_ROOT, "shader_dummy")
-        Path(gltf_to_convert[0]).write_text(
-            data.replace("https://vr.google.com/shaders/w/", shader_dummy_path)
-        )
-        subprocess.run(
-            [
-                "node",
-                CONVERTER_EXE,
-                "-i",
-                gltf_to_convert[0],
-                "-o",
-                out_path,
-                "--keepUnusedElements",
-                "--binary",
-            ]
-        )
+        try:
+            convert_gltf_to_glb(gltf_to_convert[0], out_path)
+        except ConversionError as err:
+            # Carry on with the unconverted file.
+            print(f"Failed to convert {gltf_to_convert[1]} to glb: {err}")
         converted_gltf_path = out_path
 
     # Begin upload process.
@@ -544,13 +681,16 @@ def upload_asset(
     asset.name = name
     asset.save()
 
+    graph = FormatGraph(asset)
     for mainfile in main_files:
         process_main_file(
             mainfile,
             sub_files,
             asset,
             converted_gltf_path,
+            graph,
         )
+    graph.save()
 
     # Clean up temp files.
     # TODO(james) missing_ok might squash genuine errors where the file should
@@ -573,6 +713,10 @@ def upload_asset(
     if thumbnail:
         add_thumbnail_to_asset(thumbnail, asset)
 
+    # Extracted zip members are temporary files, deleted on close.
+    for file in unzipped_files:
+        file.close()
+
     asset.state = ASSET_STATE_COMPLETE
     asset.save()
     return asset
@@ -0,0 +1,150 @@
+import json
+import mmap
+import struct
+from dataclasses import dataclass
+from typing import BinaryIO, Optional, Union
+
+import ijson
+from ijson.common import ObjectBuilder
+
+GLB_MAGIC = b"glTF"
+# Both GLB 1 (KHR_binary_glTF) and GLB 2 headers put the length of the JSON
+# content at byte 12 and the content itself at byte 20.
+GLB_HEADER_SIZE = 20
+GLB_JSON_CHUNK_TYPE = 0x4E4F534A
+
+# Primitive modes. Points and lines have no triangles.
+TRIANGLES = 4
+TRIANGLE_STRIP = 5
+TRIANGLE_FAN = 6
+
+# The only parts of a .gltf's JSON we need. Everything else, including any
+# embedded buffers, is skipped as it streams past.
+INSPECTED_KEYS = ["asset", "meshes", "accessors"]
+
+
+class GltfError(Exception):
+    pass
+
+
+@dataclass
+class GltfInfo:
+    version: int
+    triangle_count: int
+
+
+def read_glb_json(data) -> Optional[dict]:
+    """Returns the JSON chunk of GLB data, or None if it isn't a GLB. `data`
+    can be anything supporting the buffer protocol, such as an mmap."""
+    if data[:4] != GLB_MAGIC:
+        return None
+    if len(data) < GLB_HEADER_SIZE:
+        raise GltfError("Truncated GLB header.")
+    version, _, content_length, content_type = struct.unpack_from("<IIII", data, 4)
+    if version == 2 and content_type != GLB_JSON_CHUNK_TYPE:
+        raise GltfError("GLB does not start with a JSON chunk.")
+    return json.loads(bytes(data[GLB_HEADER_SIZE : GLB_HEADER_SIZE + content_length]))
+
+
+def read_gltf_json(file: BinaryIO) -> dict:
+    """Streams a .gltf file, keeping only INSPECTED_KEYS."""
+    gltf = {}
+    builders = {}
+    for prefix, event, value in ijson.parse(file):
+        if prefix == "" and event not in ["start_map", "map_key", "end_map"]:
+            raise GltfError("glTF JSON is not an object.")
+        if prefix == "" and event == "map_key":
+            if value in INSPECTED_KEYS:
+                builders[value] = ObjectBuilder()
+            continue
+        key = prefix.split(".", 1)[0]
+        if key in builders:
+            builders[key].event(event, value)
+        elif prefix == "buffers" and event == "start_map":
+            # Only glTF 1 keeps buffers in a map. We use this to tell the
+            # versions apart if `asset.version` is missing.
+            gltf["buffers"] = {}
+    for key, builder in builders.items():
+        gltf[key] = builder.value
+    return gltf
+
+
+def get_version(gltf: dict) -> int:
+    version = gltf.get("asset", {}).get("version")
+    if version is not None:
+        return int(str(version).split(".")[0])
+    if isinstance(gltf.get("buffers"), dict):
+        return 1
+    return 2
+
+
+def get_triangle_count(gltf: dict) -> int:
+    """Counts the triangles in each mesh from its primitives' accessor counts,
+    without reading any buffers. A mesh used by several nodes is counted once.
+    """
+    # glTF 1 keys meshes and accessors by id, glTF 2 by index.
+    meshes = gltf.get("meshes", [])
+    if isinstance(meshes, dict):
+        meshes = meshes.values()
+    accessors = gltf.get("accessors", [])
+    triangles = 0
+    for mesh in meshes:
+        for primitive in mesh.get("primitives", []):
+            accessor_id = primitive.get("indices")
+            if accessor_id is None:
+                accessor_id = primitive.get("attributes", {}).get("POSITION")
+            if accessor_id is None:
+                continue
+            try:
+                count = accessors[accessor_id]["count"]
+            except (IndexError, KeyError, TypeError):
+                raise GltfError(f"Primitive refers to missing accessor {accessor_id}.")
+            mode = primitive.get("mode", TRIANGLES)
+            if mode == TRIANGLES:
+                triangles += count // 3
+            elif mode in [TRIANGLE_STRIP, TRIANGLE_FAN]:
+                triangles += max(count - 2, 0)
+    return triangles
+
+
+def inspect_gltf(source: Union[str, BinaryIO]) -> GltfInfo:
+    """Reads the version and triangle count of a .gltf or .glb, given a path
+    or a binary file object. Local files are memory-mapped, so only the pages
+    holding the GLB header and JSON are read."""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return inspect_gltf(f)
+    try:
+        data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # Not backed by a real file, for example an in-memory upload.
+        data = None
+    try:
+        source.seek(0)
+        if data is not None:
+            gltf = read_glb_json(data)
+        else:
+            header = source.read(GLB_HEADER_SIZE)
+            gltf = None
+            if header[:4] == GLB_MAGIC and len(header) == GLB_HEADER_SIZE:
+                (content_length,) = struct.unpack_from("<I", header, 12)
+                gltf = read_glb_json(header + source.read(content_length))
+            elif header[:4] == GLB_MAGIC:
+                raise GltfError("Truncated GLB header.")
+        if gltf is None:
+            source.seek(0)
+            gltf = read_gltf_json(source)
+    except (ValueError, ijson.JSONError) as err:
+        raise GltfError(f"Invalid glTF JSON: {err}")
+    finally:
+        if data is not None:
+            data.close()
+        source.seek(0)
+    try:
+        return GltfInfo(
+            version=get_version(gltf),
+            triangle_count=get_triangle_count(gltf),
+        )
+    except (AttributeError, TypeError, ValueError) as err:
+        # Valid JSON, but not shaped like glTF.
+        raise GltfError(f"Invalid glTF structure: {err}")
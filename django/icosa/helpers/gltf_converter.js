@@ -0,0 +1,46 @@
+// Long-lived glTF to GLB converter, run by icosa.helpers.gltf_converter.
+//
+// Reads one JSON job per line on stdin: {"id", "input", "output",
+// "shaderDummyPath"}, and writes one JSON result per line on stdout: {"id",
+// "ok", "error"}. Jobs are handled one at a time; run more processes for
+// parallel conversions.
+
+const fs = require("fs");
+const path = require("path");
+const readline = require("readline");
+const { gltfToGlb } = require("gltf-pipeline");
+
+const SHADER_URL = "https://vr.google.com/shaders/w/";
+
+// stdout carries the protocol, so send anything else to stderr.
+console.log = console.error;
+
+async function convert(job) {
+  const data = fs
+    .readFileSync(job.input, "utf8")
+    .split(SHADER_URL)
+    .join(job.shaderDummyPath);
+  const results = await gltfToGlb(JSON.parse(data), {
+    resourceDirectory: path.dirname(job.input),
+    keepUnusedElements: true,
+  });
+  fs.writeFileSync(job.output, results.glb);
+}
+
+function reply(result) {
+  process.stdout.write(JSON.stringify(result) + "\n");
+}
+
+let jobs = Promise.resolve();
+readline.createInterface({ input: process.stdin }).on("line", (line) => {
+  jobs = jobs.then(async () => {
+    let job = {};
+    try {
+      job = JSON.parse(line);
+      await convert(job);
+      reply({ id: job.id, ok: true });
+    } catch (err) {
+      reply({ id: job.id, ok: false, error: String(err) });
+    }
+  });
+});
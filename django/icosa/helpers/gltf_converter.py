@@ -0,0 +1,128 @@
+import itertools
+import json
+import os
+import queue
+import select
+import subprocess
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+CONVERTER_SCRIPT = os.path.join(os.path.dirname(__file__), "gltf_converter.js")
+
+
+class ConversionError(Exception):
+    pass
+
+
+class ConverterWorker:
+    """A node process running gltf_converter.js, which converts one file at a
+    time. Starting node and loading gltf-pipeline is slow, so the process is
+    kept running between jobs."""
+
+    def __init__(self):
+        self.process = None
+        self.job_ids = itertools.count()
+
+    def start(self):
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen(
+                ["node", CONVERTER_SCRIPT],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+            )
+
+    def stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def convert(self, input_path: str, output_path: str, timeout: float):
+        self.start()
+        job_id = next(self.job_ids)
+        job = {
+            "id": job_id,
+            "input": input_path,
+            "output": output_path,
+            "shaderDummyPath": os.path.join(settings.STATIC_ROOT, "shader_dummy"),
+        }
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.stop()
+            raise ConversionError("Converter process exited.")
+
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            # The process may be stuck on this file, so don't reuse it.
+            self.stop()
+            raise ConversionError(f"Conversion timed out after {timeout}s.")
+        line = self.process.stdout.readline()
+        if not line:
+            self.stop()
+            raise ConversionError("Converter process exited.")
+        result = json.loads(line)
+        if result["id"] != job_id:
+            self.stop()
+            raise ConversionError("Converter process replied out of order.")
+        if not result["ok"]:
+            raise ConversionError(result["error"])
+
+
+class ConverterPool:
+    """A fixed set of converter workers. Callers block until a worker is free,
+    which limits the number of conversions running at once."""
+
+    def __init__(self, size: int, timeout: float):
+        self.timeout = timeout
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(ConverterWorker())
+
+    def warm(self):
+        """Starts every worker now, rather than on its first job."""
+        workers = [self.idle.get() for _ in range(self.idle.qsize())]
+        for worker in workers:
+            worker.start()
+            self.idle.put(worker)
+
+    def convert(self, input_path: str, output_path: str):
+        worker = self.idle.get()
+        try:
+            worker.convert(input_path, output_path, self.timeout)
+        finally:
+            self.idle.put(worker)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_converter_pool() -> ConverterPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConverterPool(
+                settings.GLTF_CONVERTER_WORKERS,
+                settings.GLTF_CONVERTER_TIMEOUT,
+            )
+    return _pool
+
+
+def convert_gltf_to_glb(input_path: str, output_path: str):
+    """Converts a glTF file, and the resources next to it, to a GLB. Raises
+    ConversionError on failure, in which case nothing is left at
+    `output_path`."""
+    # A converter stopped part way through can leave a truncated file, so only
+    # move the output into place once it has finished.
+    partial_path = f"{output_path}.partial"
+    try:
+        get_converter_pool().convert(input_path, partial_path)
+        os.replace(partial_path, output_path)
+    finally:
+        Path(partial_path).unlink(missing_ok=True)
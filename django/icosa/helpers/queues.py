@@ -0,0 +1,96 @@
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from huey.contrib.djhuey import HUEY, close_db, get_backend
+
+# Queue names, see settings.HUEY_QUEUES. Periodic maintenance tasks stay on
+# djhuey's default queue, which `run_huey` consumes.
+UPLOADS_QUEUE = "uploads"
+CONVERSIONS_QUEUE = "conversions"
+
+# Higher priorities are dequeued first, and tasks of equal priority in the
+# order they were queued. Queue bulk re-processing jobs with this, so that
+# uploads and finalize calls overtake them without overtaking each other.
+BULK_PRIORITY = -10
+
+PAYLOAD_STATS = ["count", "bytes", "max_bytes"]
+
+# Names of the tasks whose payload sizes are recorded.
+queued_task_names = set()
+
+
+@lru_cache(maxsize=None)
+def get_queue(name: str):
+    """Returns the Huey instance for a named queue. All queues share the
+    default queue's backend and connection, and are kept apart by name."""
+    if name not in settings.HUEY_QUEUES:
+        raise KeyError(f"Unknown task queue {name}.")
+    config = settings.HUEY.copy()
+    backend_cls = get_backend(config.pop("huey_class"))
+    config.pop("name", None)
+    config.pop("consumer", None)
+    config.update(config.pop("connection", {}))
+    config["immediate"] = HUEY.immediate
+    return backend_cls(name, **config)
+
+
+def get_consumer_options(name: str) -> dict:
+    options = settings.HUEY.get("consumer", {}).copy()
+    options.update(settings.HUEY_QUEUES[name])
+    return options
+
+
+def payload_stats_key(task_name: str, stat: str) -> str:
+    return f"task_payload:{task_name}:{stat}"
+
+
+def record_payload_size(task_name: str, size: int):
+    for stat, amount in [("count", 1), ("bytes", size)]:
+        key = payload_stats_key(task_name, stat)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)
+    key = payload_stats_key(task_name, "max_bytes")
+    if size > cache.get(key, 0):
+        cache.set(key, size, None)
+
+
+def get_payload_stats() -> dict:
+    stats = {}
+    for task_name in sorted(queued_task_names):
+        keys = [payload_stats_key(task_name, stat) for stat in PAYLOAD_STATS]
+        values = cache.get_many(keys)
+        stats[task_name] = {
+            stat: values.get(key, 0) for stat, key in zip(PAYLOAD_STATS, keys)
+        }
+    return stats
+
+
+def queue_on_commit_task(queue: str, *args, **kwargs):
+    """Like djhuey's `on_commit_task`, but for a named queue. Also records the
+    size of each serialized task, see `get_payload_stats`."""
+
+    def decorator(fn):
+        huey = get_queue(queue)
+        task_wrapper = huey.task(*args, **kwargs)(close_db(fn))
+        queued_task_names.add(task_wrapper.name)
+
+        @wraps(fn)
+        def inner(*a, **k):
+            task = task_wrapper.s(*a, **k)
+
+            def enqueue_on_commit():
+                record_payload_size(task.name, len(huey.serialize_task(task)))
+                huey.enqueue(task)
+
+            transaction.on_commit(enqueue_on_commit)
+            return huey._result_handle(task)
+
+        inner.call_local = fn
+        inner.task_wrapper = task_wrapper
+        return inner
+
+    return decorator
@@ -0,0 +1,51 @@
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from icosa.helpers.cache import ASSET_LIST_GENERATION, bump_generations
+from icosa.models import PUBLIC, Asset, RankUpdateLog, get_rank_expression
+
+
+def update_ranks(batch_size: int = None) -> RankUpdateLog:
+    """Recomputes rank for every public asset in SQL, in batches of
+    `batch_size` assets ordered by id. A batch size of 0 updates them all in a
+    single statement. Each run is recorded in a RankUpdateLog."""
+    if batch_size is None:
+        batch_size = settings.RANK_UPDATE_BATCH_SIZE
+    start_time = timezone.now()
+    start = time.monotonic()
+    # Use the same recency reference for the whole run, so that batches are
+    # ranked consistently.
+    now = datetime.now()
+    assets = Asset.objects.filter(visibility=PUBLIC)
+
+    if not batch_size:
+        asset_count = assets.update(rank=get_rank_expression(now=now))
+    else:
+        asset_count = 0
+        last_pk = None
+        while True:
+            batch = assets.order_by("pk")
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            # The last id in this batch, or None if this is the final batch.
+            end_pk = next(
+                iter(batch.values_list("pk", flat=True)[batch_size - 1 : batch_size]),
+                None,
+            )
+            if end_pk is not None:
+                batch = batch.filter(pk__lte=end_pk)
+            asset_count += batch.order_by().update(rank=get_rank_expression(now=now))
+            if end_pk is None:
+                break
+            last_pk = end_pk
+
+    # Listings ordered by rank may have changed.
+    bump_generations(ASSET_LIST_GENERATION)
+
+    return RankUpdateLog.objects.create(
+        start_time=start_time,
+        duration=time.monotonic() - start,
+        asset_count=asset_count,
+    )
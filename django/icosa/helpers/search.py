@@ -0,0 +1,83 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity,
+)
+from django.db.models import F, Q
+from django.db.models.query import QuerySet
+from django.utils.module_loading import import_string
+
+DEFAULT_SEARCH_BACKEND = "icosa.helpers.search.PostgresSearchBackend"
+
+# Must match the config used to build Asset.search_vector.
+SEARCH_CONFIG = "english"
+
+SEARCH_TERM_REGEX = re.compile(r"\w+")
+
+
+class SearchBackend:
+    """Filters, and optionally orders, an Asset queryset by a user's search
+    query. Used by both the API's `keywords` filter and the web search page.
+    """
+
+    def search(self, assets: QuerySet, query: str) -> QuerySet:
+        raise NotImplementedError
+
+
+class IcontainsSearchBackend(SearchBackend):
+    """Matches every space-separated term anywhere in Asset.search_text.
+
+    This needs no database support, but cannot use an index and so scans the
+    whole table.
+    """
+
+    def search(self, assets: QuerySet, query: str) -> QuerySet:
+        q = Q()
+        for keyword in query.split(" "):
+            q &= Q(search_text__icontains=keyword)
+        return assets.filter(q)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Full-text search over the GIN-indexed Asset.search_vector.
+
+    Each term is matched as a prefix and results are ordered by ts_rank. If
+    nothing matches, we fall back to trigram similarity against search_text
+    to catch typos.
+    """
+
+    def get_search_query(self, query: str) -> SearchQuery | None:
+        terms = SEARCH_TERM_REGEX.findall(query.lower())
+        if not terms:
+            return None
+        raw = " & ".join(f"{term}:*" for term in terms)
+        return SearchQuery(raw, search_type="raw", config=SEARCH_CONFIG)
+
+    def search(self, assets: QuerySet, query: str) -> QuerySet:
+        search_query = self.get_search_query(query)
+        if search_query is None:
+            return assets
+        results = assets.filter(search_vector=search_query)
+        if results.exists():
+            return results.annotate(
+                search_rank=SearchRank(F("search_vector"), search_query),
+            ).order_by("-search_rank", "-rank")
+        # The `trigram_word_similar` lookup can use the trigram index on
+        # search_text; the similarity itself is only computed for ordering.
+        return (
+            assets.filter(search_text__trigram_word_similar=query)
+            .annotate(
+                search_rank=TrigramWordSimilarity(query, "search_text"),
+            )
+            .order_by("-search_rank", "-rank")
+        )
+
+
+@lru_cache(maxsize=None)
+def get_search_backend() -> SearchBackend:
+    backend_path = getattr(settings, "SEARCH_BACKEND", DEFAULT_SEARCH_BACKEND)
+    return import_string(backend_path)()
@@ -1,15 +1,133 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from b2sdk._internal.exception import FileNotHidden, FileNotPresent
 from b2sdk.v2 import B2Api, InMemoryAccountInfo
 
 from django.conf import settings
 
+B2_BUCKET_NAME = "icosa-gallery"
+
+# Concurrent hides in `hide_files`. b2sdk sends everything through one
+# requests session, whose connection pool holds 10 connections per host.
+HIDE_WORKERS = 10
+
+
+class HideFilesError(Exception):
+    def __init__(self, file_names: List[str]):
+        super().__init__(f"Failed to hide {len(file_names)} files")
+        self.file_names = file_names
+
+
+class StorageClient:
+    """Hides and unhides media files in the bucket behind default storage.
+    Hidden files stop being served but can be restored."""
+
+    def hide_file(self, file_name: str):
+        raise NotImplementedError
+
+    def unhide_file(self, file_name: str):
+        """Raises FileNotPresent if there's no such file, and FileNotHidden if
+        it isn't hidden."""
+        raise NotImplementedError
+
+    def hide_files(self, file_names: List[str]) -> Tuple[List[str], List[str]]:
+        """Hides files concurrently, returning the names of those hidden and
+        those which failed."""
+        hidden = []
+        failed = []
+        with ThreadPoolExecutor(HIDE_WORKERS) as executor:
+            futures = [
+                (file_name, executor.submit(self.hide_file, file_name))
+                for file_name in file_names
+            ]
+            for file_name, future in futures:
+                try:
+                    future.result()
+                except Exception as err:
+                    print(f"Failed to hide {file_name}: {err}")
+                    failed.append(file_name)
+                else:
+                    hidden.append(file_name)
+        return hidden, failed
+
+
+class B2StorageClient(StorageClient):
+    """Shares one authorized B2Api, and so one HTTP session, between every
+    caller in the process. b2sdk reauthorizes by itself when the token
+    expires, as the account info keeps the key."""
+
+    def __init__(self):
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    b2_api = B2Api(InMemoryAccountInfo())
+                    b2_api.authorize_account(
+                        "production",
+                        settings.DJANGO_STORAGE_ACCESS_KEY,
+                        settings.DJANGO_STORAGE_SECRET_KEY,
+                    )
+                    self._bucket = b2_api.get_bucket_by_name(B2_BUCKET_NAME)
+        return self._bucket
+
+    def hide_file(self, file_name: str):
+        self.bucket.hide_file(file_name)
+
+    def unhide_file(self, file_name: str):
+        self.bucket.unhide_file(file_name)
+
+
+class LocalStorageClient(StorageClient):
+    """Stands in for B2 with a local directory, for development and tests.
+    Hiding a file moves it under `.hidden` in the same directory."""
+
+    def __init__(self, root=None):
+        self.root = root or settings.MEDIA_ROOT
+
+    def get_paths(self, file_name: str) -> Tuple[str, str]:
+        path = os.path.join(self.root, file_name)
+        hidden_path = os.path.join(self.root, ".hidden", file_name)
+        return path, hidden_path
+
+    def hide_file(self, file_name: str):
+        path, hidden_path = self.get_paths(file_name)
+        if not os.path.exists(path):
+            raise FileNotPresent(file_id_or_name=file_name)
+        os.makedirs(os.path.dirname(hidden_path), exist_ok=True)
+        os.replace(path, hidden_path)
+
+    def unhide_file(self, file_name: str):
+        path, hidden_path = self.get_paths(file_name)
+        if os.path.exists(path):
+            raise FileNotHidden(file_name)
+        if not os.path.exists(hidden_path):
+            raise FileNotPresent(file_id_or_name=file_name)
+        os.replace(hidden_path, path)
+
+
+# The B2 client authorizes on first use.
+b2_client = B2StorageClient()
+local_client = None
+
+
+def get_storage_client() -> StorageClient:
+    """Returns the process-wide client chosen by settings.MEDIA_STORAGE_CLIENT,
+    either "b2" or "local"."""
+    global local_client
+    if settings.MEDIA_STORAGE_CLIENT == "local":
+        if local_client is None:
+            local_client = LocalStorageClient()
+        return local_client
+    return b2_client
+
 
 def get_b2_bucket():
-    info = InMemoryAccountInfo()
-    b2_api = B2Api(info)
-    b2_api.authorize_account(
-        "production",
-        settings.DJANGO_STORAGE_ACCESS_KEY,
-        settings.DJANGO_STORAGE_SECRET_KEY,
-    )
-    bucket = b2_api.get_bucket_by_name("icosa-gallery")
-    return bucket
+    """The shared B2 bucket, for callers which need the full b2sdk API."""
+    return b2_client.bucket
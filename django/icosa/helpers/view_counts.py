@@ -0,0 +1,72 @@
+from functools import lru_cache
+from typing import Dict
+
+import redis
+from django.conf import settings
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from icosa.models import Asset, get_rank_expression
+
+# Pending view counts are a Redis hash of asset id to views not yet written to
+# the database. A flush first renames it, so views recorded during a flush
+# aren't lost; a flush that dies part way is picked up by the next one.
+VIEW_COUNTS_KEY = "icosa:asset_views"
+FLUSHING_VIEW_COUNTS_KEY = "icosa:asset_views:flushing"
+
+DEFAULT_FLUSH_BATCH_SIZE = 1000
+
+
+@lru_cache(maxsize=None)
+def get_view_counts_client():
+    url = getattr(settings, "VIEW_COUNTS_REDIS_URL", None)
+    if not url:
+        return None
+    return redis.Redis.from_url(url)
+
+
+def record_asset_view(asset_id: int):
+    """Counts one view of an asset. Without VIEW_COUNTS_REDIS_URL configured,
+    the view is written straight to the database."""
+    client = get_view_counts_client()
+    if client is None:
+        apply_view_counts({asset_id: 1})
+        return
+    client.hincrby(VIEW_COUNTS_KEY, asset_id, 1)
+
+
+def apply_view_counts(view_counts: Dict[int, int]):
+    """Adds each asset's new views to its count, and re-ranks it, with a single
+    UPDATE."""
+    if not view_counts:
+        return
+    delta = Case(
+        *[When(pk=pk, then=Value(count)) for pk, count in view_counts.items()],
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    )
+    views = F("views") + delta
+    Asset.objects.filter(pk__in=view_counts.keys()).update(
+        views=views,
+        rank=get_rank_expression(views=views),
+    )
+
+
+def flush_view_counts(batch_size: int = DEFAULT_FLUSH_BATCH_SIZE):
+    client = get_view_counts_client()
+    if client is None:
+        return
+    if not client.exists(FLUSHING_VIEW_COUNTS_KEY):
+        try:
+            client.rename(VIEW_COUNTS_KEY, FLUSHING_VIEW_COUNTS_KEY)
+        except redis.ResponseError:
+            # No views have been recorded since the last flush.
+            return
+    view_counts = {
+        int(pk): int(count)
+        for pk, count in client.hgetall(FLUSHING_VIEW_COUNTS_KEY).items()
+    }
+    # Updating in a consistent order avoids deadlocks with other writers.
+    pks = sorted(view_counts.keys())
+    for i in range(0, len(pks), batch_size):
+        batch = {pk: view_counts[pk] for pk in pks[i : i + batch_size]}
+        apply_view_counts(batch)
+        client.hdel(FLUSHING_VIEW_COUNTS_KEY, *batch.keys())
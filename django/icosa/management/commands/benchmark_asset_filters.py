@@ -0,0 +1,90 @@
+import statistics
+import time
+
+from icosa.api import DEFAULT_PAGE_SIZE, prefetch_asset_schema
+from icosa.api.filters import filter_assets, get_order_by, sort_assets
+from icosa.api.schema import AssetFilters
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+DEFAULT_REPEAT = 5
+
+# The filter combinations most used by API clients and the web listings.
+BENCHMARKS = {
+    "best": {"orderBy": "BEST"},
+    "newest": {"orderBy": "NEWEST"},
+    "curated": {"curated": True, "orderBy": "BEST"},
+    "category": {"category": "ANIMALS", "orderBy": "BEST"},
+    "format": {"format": ["GLTF2"], "orderBy": "BEST"},
+    "tag": {"tag": ["tiltbrush"], "orderBy": "BEST"},
+    "tags": {"tag": ["tiltbrush", "blocks"], "orderBy": "NEWEST"},
+    "tags_all": {"tag": ["tiltbrush", "animals"], "tagMatch": "ALL", "orderBy": "BEST"},
+    "license": {"license": "CREATIVE_COMMONS_BY", "orderBy": "BEST"},
+    "complexity": {"maxComplexity": "SIMPLE", "orderBy": "BEST"},
+    "keywords": {"keywords": "tree"},
+    "combined": {
+        "category": "ANIMALS",
+        "format": ["GLTF2"],
+        "tag": ["tiltbrush"],
+        "orderBy": "BEST",
+    },
+}
+
+
+def get_page_bytes(page) -> int:
+    """The size of the rows Postgres sends for a page of assets, not counting
+    prefetches or protocol overhead."""
+    sql, params = page.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT coalesce(sum(pg_column_size(page.*)), 0) FROM ({sql}) page",
+            params,
+        )
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+
+    help = """Times the first page of the asset listing for common filter
+    combinations, as the API builds it, and measures the bytes it loads"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "benchmarks",
+            nargs="*",
+            choices=list(BENCHMARKS.keys()),
+            help="Only run these benchmarks",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=DEFAULT_REPEAT,
+            help=f"Number of runs per benchmark (default {DEFAULT_REPEAT})",
+        )
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="Print each query's plan, as run, after its timings",
+        )
+
+    def handle(self, *args, **options):
+        names = options["benchmarks"] or list(BENCHMARKS.keys())
+        for name in names:
+            filters = AssetFilters(**BENCHMARKS[name])
+            assets = sort_assets(get_order_by(filters), filter_assets(filters))
+            page = prefetch_asset_schema(assets)[:DEFAULT_PAGE_SIZE]
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                assets.count()
+                list(page)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(
+                f"{name}: median {statistics.median(timings):.1f}ms, "
+                f"min {min(timings):.1f}ms, max {max(timings):.1f}ms, "
+                f"page {get_page_bytes(page)} bytes "
+                f"({get_page_bytes(page.defer(None))} with every column)"
+            )
+            if options["explain"]:
+                print(assets[:DEFAULT_PAGE_SIZE].explain(analyze=True, buffers=True))
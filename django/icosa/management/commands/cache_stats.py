@@ -0,0 +1,32 @@
+from icosa.helpers.cache import get_cache_stats, reset_cache_stats
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+
+    help = """Shows hit and miss counts for cached API views"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counts to zero after showing them",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.SHARED_CACHE:
+            print(
+                "Warning: the cache isn't shared between processes, so these "
+                "counts only cover this command's own process. Set "
+                "DJANGO_CACHE_REDIS_URL to share it."
+            )
+        stats = get_cache_stats()
+        total = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / total if total else 0
+        print(f"Hits: {stats['hits']}")
+        print(f"Misses: {stats['misses']}")
+        print(f"Hit ratio: {ratio:.1%}")
+        if options["reset"]:
+            reset_cache_stats()
@@ -1,9 +1,21 @@
+import io
 import json
 import os
 import secrets
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
+from icosa.helpers.cache import ASSET_LIST_GENERATION, bump_generations
 from icosa.helpers.file import get_content_type, is_gltf2
 from icosa.helpers.format_roles import EXTENSION_ROLE_MAP
 from icosa.helpers.snowflake import generate_snowflake
@@ -13,19 +25,33 @@ from icosa.models import (
     CATEGORY_CHOICES,
     FORMAT_ROLE_CHOICES,
     Asset,
+    AssetOwner,
     PolyFormat,
     PolyResource,
     Tag,
-    User,
 )
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 # IMPORT_SOURCE = "google_poly"
 IMPORT_SOURCE = "internet_archive"
 
 POLY_JSON_DIR = "polygone_data"
 ASSETS_JSON_DIR = f"{POLY_JSON_DIR}/assets"
+ALL_DATA_FILE = "./all_data.jsonl"
+CHECKPOINT_FILE = "./import_poly_assets.checkpoint"
+# Each store has its own manifest, so switching stores downloads afresh.
+MANIFEST_FILE = POLY_JSON_DIR + "/downloaded-{store}.txt"
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_DOWNLOAD_WORKERS = 16
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_BACKOFF = 1  # Seconds before the first retry, doubling each time.
+# Keys are written to the manifest in batches of this many, each after the
+# store has made their files durable.
+MANIFEST_BATCH_SIZE = 1000
 
 FORMAT_ROLE_MAP = {x[1]: x[0] for x in FORMAT_ROLE_CHOICES}
 
@@ -42,224 +68,229 @@ PROCESS_VIA_GLTF_PARSING = False
 IGNORE_SCRAPED_DATA = True
 
 
-def get_json_from_b2(dir):
-    bucket = get_b2_bucket()
-    json_files = bucket.ls(
-        folder_to_list="poly/*/data.json",
-        latest_only=True,
-        recursive=True,
-        with_wildcard=True,
-    )
-    print("Downloading files...")
-    for version, _ in json_files:
-        # Strip the `/poly/` element off the path; we don't need that.
-        path = os.path.join(dir, *version.file_name.split("/")[1:-1])
-        path_with_file = os.path.join(path, "data.json")
-        if os.path.exists(path_with_file):
-            # Assuming the json data will never change once downloaded.
-            print(version.file_name, "already exists; skipping.")
-        else:
-            print("Downloading", version.file_name, "...")
-            download = version.download()
-            # Create destination path only after download was successful.
-            Path(path).mkdir(parents=True, exist_ok=True)
-            download.save_to(path_with_file)
-    print("Finished downloading files.")
-
-
-def get_or_create_asset(directory, data, curated=False):
-    user, _ = User.objects.get_or_create(
-        url=data["authorId"],
-        defaults={
-            "password": secrets.token_bytes(16),
-            "displayname": data["authorName"],
-            "imported": True,
-        },
-    )
-    presentation_params = data.get("presentationParams", {})
-    # A couple of background colours are expressed as malformed
-    # rgb() values. Let's make them the default if so.
-    background_color = presentation_params.get("backgroundColor", None)
-    if background_color is not None and len(background_color) > 7:
-        presentation_params["backgroundColor"] = "#000000"
-
-    license = data.get("licence", "")
-
-    if license in ["CREATIVE_COMMONS_BY", "CREATIVE_COMMONS_BY_ND"]:
-        license = f"{license}_3_0"
-
-    return Asset.objects.get_or_create(
-        url=directory,
-        defaults=dict(
-            state=ASSET_STATE_COMPLETE,
-            name=data["name"],
-            id=generate_snowflake(),
-            imported_from=IMPORT_SOURCE,
-            formats="",
-            owner=user,
-            description=data.get("description", None),
-            visibility=data["visibility"],
-            curated=curated,
-            polyid=directory,
-            polydata=data,
-            license=license,
-            create_time=datetime.fromisoformat(
-                data["createTime"].replace("Z", "+00:00")
-            ),
-            update_time=datetime.fromisoformat(
-                data["updateTime"].replace("Z", "+00:00")
-            ),
-            transform=data.get("transform", None),
-            camera=data.get("camera", None),
-            presentation_params=presentation_params,
-            historical_likes=data["likes"],
-            historical_views=data["views"],
-            category=CATEGORY_REVERSE_MAP.get(data["category"], None),
-        ),
-    )
-
-
-def create_formats_from_scraped_data(
-    directory, gltf2_data, formats_json, asset
-):
-    done_thumbnail = False
-    for format_json in formats_json:
-        format = PolyFormat.objects.create(
-            asset=asset,
-            format_type=format_json["formatType"],
+class B2Source:
+    """Lists and reads the scraped data.json files in the B2 bucket."""
+
+    def __init__(self):
+        self.bucket = get_b2_bucket()
+
+    def list_keys(self):
+        json_files = self.bucket.ls(
+            folder_to_list="poly/*/data.json",
+            latest_only=True,
+            recursive=True,
+            with_wildcard=True,
         )
-        if format_json.get("formatComplexity", None) is not None:
-            format_complexity_json = format_json["formatComplexity"]
-            format.triangle_count = format_complexity_json.get(
-                "triangleCount", None
-            )
-            format.lod_hint = format_complexity_json.get("lodHint", None)
-            format.save()
-
-        # Manually create thumbnails and assume that the files exist on B2 in
-        # the right place.
-        if not done_thumbnail:
-            asset.thumbnail = f"poly/{directory}/thumbnail.png"
-            asset.thumbnail_contenttype = "image/png"
-            asset.save()
-            done_thumbnail = True
-        root_resource_json = format_json["root"]
-
-        file_path = root_resource_json["relativePath"]
-        extension = os.path.splitext(file_path)[-1].lower()
-
-        root_resource_data = {
-            "file": f"poly/{directory}/{file_path}",
-            "is_root": True,
-            "format": format,
-            "asset": asset,
-            "contenttype": root_resource_json["contentType"],
-        }
-        root_resource = PolyResource.objects.create(**root_resource_data)
-
-        role = EXTENSION_ROLE_MAP.get(extension)
-        format.role = role
-        format.save()
-
-        if PROCESS_VIA_JSON_OVERRIDES:
-            # Retrospectively override the parent Format's type if we find a
-            # special case.
-            # Note: This code will over-match and set all GLTFs to GLTF2 given
-            # the right pathological data. However in the case of the polygone
-            # scrape, we know that for each root resource, there is only one
-            # file with the name {file_path} and so this is ok to blindly set
-            # it to GLTF2.
-            gltf_override_key = f"{directory}\\{file_path}"
-            if gltf2_data.get(gltf_override_key, False):
-                # print(f"Overwriting format_type for {gltf_override_key}")
-                format.format_type = "GLTF2"
-                format.save()
-
-        if PROCESS_VIA_GLTF_PARSING:
-            # Don't trust the format_type we got from the json. Instead, parse
-            # the gltf to work out if it's version 1 or 2.
-            if extension == ".gltf":
-                if is_gltf2(root_resource.file.file):
-                    format.format_type = "GLTF2"
-                else:
-                    format.format_type = "GLTF"
-                format.save()
+        for version, _ in json_files:
+            yield version.file_name
 
-        if format_json.get("resources", None) is not None:
-            for resource_json in format_json["resources"]:
+    def read(self, key):
+        out = io.BytesIO()
+        self.bucket.download_file_by_name(key).save(out)
+        return out.getvalue()
 
-                file_path = resource_json["relativePath"]
 
-                resource_data = {
-                    "file": f"poly/{directory}/{file_path}",
-                    "is_root": False,
-                    "format": format,
-                    "asset": asset,
-                    "contenttype": resource_json["contentType"],
-                }
-                PolyResource.objects.create(**resource_data)
+class LocalSource:
+    """Stands in for B2Source with a directory laid out like the bucket."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def list_keys(self):
+        for path in sorted(Path(self.root).glob("poly/*/data.json")):
+            yield path.relative_to(self.root).as_posix()
+
+    def read(self, key):
+        with open(os.path.join(self.root, key), "rb") as f:
+            return f.read()
+
+
+class DirectoryStore:
+    """Keeps each asset's data.json in a directory named after the asset."""
+
+    def __init__(self, root=ASSETS_JSON_DIR):
+        self.root = root
+
+    def ids(self):
+        return os.listdir(self.root)
+
+    def get(self, asset_id):
+        with open(os.path.join(self.root, asset_id, "data.json")) as f:
+            return json.load(f)
+
+    def put(self, asset_id, data):
+        path = os.path.join(self.root, asset_id)
+        Path(path).mkdir(parents=True, exist_ok=True)
+        with open(os.path.join(path, "data.json"), "wb") as f:
+            f.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
 
 
-def create_formats_from_archive_data(formats_json, asset):
-    # done_thumbnail = False
-    for format_json in formats_json:
-        format = PolyFormat.objects.create(
-            asset=asset,
-            format_type=format_json["formatType"],
+class JsonlStore:
+    """Packs every data.json into one file, one `[asset_id, data]` per line.
+    The last line for an asset wins."""
+
+    def __init__(self, path=f"{POLY_JSON_DIR}/assets.jsonl"):
+        self.path = path
+        self.offsets = None
+        self.file = None
+
+    def index(self):
+        if self.offsets is None:
+            self.offsets = {}
+            with open(self.path, "rb") as f:
+                while True:
+                    offset = f.tell()
+                    line = f.readline()
+                    if not line:
+                        break
+                    asset_id = json.loads(line)[0]
+                    self.offsets[asset_id] = offset
+        return self.offsets
+
+    def ids(self):
+        return self.index().keys()
+
+    def get(self, asset_id):
+        if self.file is None:
+            self.file = open(self.path, "rb")
+        self.file.seek(self.index()[asset_id])
+        return json.loads(self.file.readline())[1]
+
+    def put(self, asset_id, data):
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        line = json.dumps([asset_id, json.loads(data)], separators=(",", ":"))
+        self.file.write(f"{line}\n".encode())
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class SqliteStore:
+    """Packs every data.json into one SQLite table."""
+
+    def __init__(self, path=f"{POLY_JSON_DIR}/assets.sqlite3"):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS assets (asset_id TEXT PRIMARY KEY, data TEXT)"
         )
 
-        if format_json.get("formatComplexity", None) is not None:
-            format_complexity_json = format_json["formatComplexity"]
-            format.triangle_count = format_complexity_json.get(
-                "triangleCount", None
-            )
-            format.lod_hint = format_complexity_json.get("lodHint", None)
-            format.save()
-
-        # TODO(james): we need to either download the thumbnail from
-        # archive.org and store it ourselves or add another field for external
-        # thumbnail which references the external image.
-
-        # Manually create thumbnails from our assumptions about the data.
-        # if not done_thumbnail:
-        #     asset.thumbnail = f"poly/{directory}/thumbnail.png"
-        #     asset.thumbnail_contenttype = "image/png"
-        #     asset.save()
-        # done_thumbnail = True
-        root_resource_json = format_json["root"]
-        url = root_resource_json["url"]
-        root_resource_data = {
-            "external_url": f"https://web.archive.org/web/{url}",
-            "is_root": True,
-            "format": format,
-            "asset": asset,
-            "contenttype": get_content_type(url),
-        }
+    def ids(self):
+        rows = self.connection.execute("SELECT asset_id FROM assets")
+        return [row[0] for row in rows]
 
-        PolyResource.objects.create(**root_resource_data)
-
-        role = FORMAT_ROLE_MAP[root_resource_json["role"]]
-        if role is not None:
-            format.role = role
-            format.save()
-
-        if format_json.get("resources", None) is not None:
-            for resource_json in format_json["resources"]:
-                url = resource_json["url"]
-                resource_data = {
-                    "external_url": f"https://web.archive.org/web/{url}",
-                    "is_root": False,
-                    "format": format,
-                    "asset": asset,
-                    "contenttype": get_content_type(url),
-                }
-                PolyResource.objects.create(**resource_data)
-            # If a format has many files associated with it (i.e. it has a
-            # `resources` key), then we want to grab the archive url if we have
-            # it so we can provide this in the download options for the user.
-            if format_json.get("archive", None):
-                format.archive_url = format_json["archive"]["url"]
-                format.save()
+    def get(self, asset_id):
+        row = self.connection.execute(
+            "SELECT data FROM assets WHERE asset_id = ?", [asset_id]
+        ).fetchone()
+        return json.loads(row[0])
+
+    def put(self, asset_id, data):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO assets VALUES (?, ?)", [asset_id, data.decode()]
+        )
+
+    def flush(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+STORES = {
+    "dirs": DirectoryStore,
+    "jsonl": JsonlStore,
+    "sqlite": SqliteStore,
+}
+
+
+def read_manifest(path):
+    try:
+        with open(path) as f:
+            return set(f.read().split())
+    except FileNotFoundError:
+        return set()
+
+
+def read_with_retry(source, key):
+    for attempt in range(DOWNLOAD_RETRIES):
+        try:
+            return source.read(key)
+        except Exception as err:
+            if attempt == DOWNLOAD_RETRIES - 1:
+                raise
+            delay = DOWNLOAD_BACKOFF * 2**attempt
+            print(f"Failed to download {key} ({err}); retrying in {delay}s")
+            time.sleep(delay)
+
+
+def write_manifest(manifest, store, keys):
+    # Flush the store before the manifest claims its files are done, so that
+    # a killed run never skips files that weren't stored.
+    store.flush()
+    manifest.writelines(f"{key}\n" for key in keys)
+    manifest.flush()
+    keys.clear()
+
+
+def download_json(source, store, workers, manifest_path):
+    """Copies every data.json from `source` into `store` across a pool of
+    threads. Completed keys are appended to a manifest, so that an
+    interrupted run can pick up where it left off without checking what it
+    already has."""
+    done = read_manifest(manifest_path)
+    keys = [key for key in source.list_keys() if key not in done]
+    print(f"Downloading {len(keys)} files ({len(done)} already done)...")
+    start = time.monotonic()
+    failed = 0
+    stored = []
+    count = 0
+    unsubmitted = iter(keys)
+    # Futures still being downloaded or waiting to be stored. Only a few are
+    # submitted ahead, and each is dropped once stored, so that memory use
+    # doesn't grow with the number of files.
+    pending = {}
+    with open(manifest_path, "a") as manifest, ThreadPoolExecutor(workers) as executor:
+        try:
+            while True:
+                for key in islice(unsubmitted, workers * 2 - len(pending)):
+                    pending[executor.submit(read_with_retry, source, key)] = key
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key = pending.pop(future)
+                    count += 1
+                    try:
+                        data = future.result()
+                        # Keys look like poly/{asset_id}/data.json.
+                        store.put(key.split("/")[1], data)
+                    except Exception as err:
+                        print(f"Giving up on {key}: {err}")
+                        failed += 1
+                        continue
+                    stored.append(key)
+                    if len(stored) >= MANIFEST_BATCH_SIZE:
+                        write_manifest(manifest, store, stored)
+                    if count % 1000 == 0:
+                        elapsed = time.monotonic() - start
+                        print(f"{count} of {len(keys)} | {count / elapsed:.0f} files/s")
+        finally:
+            write_manifest(manifest, store, stored)
+            store.close()
+    print(f"Finished downloading files. {failed} failed.")
 
 
 def dedup_scrape_formats(formats, asset_id):
@@ -281,6 +312,373 @@ def dedup_scrape_formats(formats, asset_id):
     return new_formats
 
 
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def is_valid_asset(archive_data):
+    for format in archive_data["formats"]:
+        if format["formatType"] in VALID_TYPES:
+            return True
+    return False
+
+
+def read_chunks(json_file, chunk_size):
+    """Yields lists of up to `chunk_size` lines from a file opened in binary
+    mode, each with the offset just after its last line."""
+    lines = []
+    while True:
+        line = json_file.readline()
+        if line:
+            lines.append(line)
+        if lines and (not line or len(lines) == chunk_size):
+            yield lines, json_file.tell()
+            lines = []
+        if not line:
+            return
+
+
+def parse_lines(lines):
+    return [json.loads(line) for line in lines]
+
+
+def parse_chunks(chunks, workers):
+    """Parses chunks of json lines in order, across a pool of `workers`
+    processes if given. Only a few chunks are read ahead of the one being
+    imported."""
+    if not workers:
+        for lines, offset in chunks:
+            yield parse_lines(lines), offset
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for lines, offset in chunks:
+            pending.append((executor.submit(parse_lines, lines), offset))
+            if len(pending) >= workers * 2:
+                future, offset = pending.popleft()
+                yield future.result(), offset
+        while pending:
+            future, offset = pending.popleft()
+            yield future.result(), offset
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, offset):
+    with open(f"{path}.tmp", "w") as f:
+        f.write(str(offset))
+    os.replace(f"{path}.tmp", path)
+
+
+class BulkImporter:
+    """Builds the assets in a chunk of all_data.jsonl, along with their tags,
+    formats and resources, in memory and saves them with one insert per
+    table. Denorms are left for recompute_denorms to fill in afterwards."""
+
+    def __init__(self, directories, store, gltf2_data):
+        self.directories = directories
+        self.store = store
+        self.gltf2_data = gltf2_data
+        self.used_ids = set()
+
+    def generate_id(self):
+        # Snowflakes only have room for 15 ids per millisecond, which bulk
+        # building can outpace.
+        id = generate_snowflake()
+        while id in self.used_ids:
+            id = generate_snowflake()
+        self.used_ids.add(id)
+        return id
+
+    def get_records(self, chunk):
+        records = {}
+        invalid = []
+        for archive_data in chunk:
+            asset_id = archive_data["assetId"]
+            if IGNORE_SCRAPED_DATA:
+                if asset_id in self.directories:
+                    continue
+                # Create empty, dummy scrape data.
+                scrape_data = {
+                    "tags": [],
+                }
+                scrape_formats = []
+            else:
+                # Skip importing if the asset is not in the scraped json.
+                if asset_id not in self.directories:
+                    continue
+                scrape_data = self.store.get(asset_id)
+                scrape_formats = dedup_scrape_formats(
+                    scrape_data["formats"], asset_id
+                )
+            if not is_valid_asset(archive_data):
+                invalid.append(asset_id)
+                continue
+            records.setdefault(asset_id, (archive_data, scrape_data, scrape_formats))
+        if invalid:
+            with open("./invalid_assets.log", "a") as log:
+                log.writelines(f"{asset_id}\n" for asset_id in invalid)
+        return records
+
+    def get_owners(self, records):
+        author_names = {}
+        for archive_data, _, _ in records.values():
+            author_names.setdefault(
+                archive_data["authorId"], archive_data["authorName"]
+            )
+        owners = {
+            owner.url: owner
+            for owner in AssetOwner.objects.filter(url__in=author_names.keys())
+        }
+        new_owners = [
+            AssetOwner(
+                url=url,
+                password=secrets.token_bytes(16),
+                displayname=displayname,
+                imported=True,
+            )
+            for url, displayname in author_names.items()
+            if url not in owners
+        ]
+        for owner in AssetOwner.objects.bulk_create(new_owners):
+            owners[owner.url] = owner
+        return owners
+
+    def get_tag_ids(self, names):
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in names], ignore_conflicts=True
+        )
+        return dict(Tag.objects.filter(name__in=names).values_list("name", "pk"))
+
+    def build_asset(self, directory, data, owner, curated):
+        presentation_params = data.get("presentationParams", {})
+        # A couple of background colours are expressed as malformed
+        # rgb() values. Let's make them the default if so.
+        background_color = presentation_params.get("backgroundColor", None)
+        if background_color is not None and len(background_color) > 7:
+            presentation_params["backgroundColor"] = "#000000"
+
+        license = data.get("licence", "")
+
+        if license in ["CREATIVE_COMMONS_BY", "CREATIVE_COMMONS_BY_ND"]:
+            license = f"{license}_3_0"
+
+        return Asset(
+            url=directory,
+            state=ASSET_STATE_COMPLETE,
+            name=data["name"],
+            id=self.generate_id(),
+            imported_from=IMPORT_SOURCE,
+            formats="",
+            owner=owner,
+            description=data.get("description", None),
+            visibility=data["visibility"],
+            curated=curated,
+            polyid=directory,
+            polydata=data,
+            license=license,
+            create_time=parse_timestamp(data["createTime"]),
+            update_time=parse_timestamp(data["updateTime"]),
+            transform=data.get("transform", None),
+            camera=data.get("camera", None),
+            presentation_params=presentation_params,
+            historical_likes=data["likes"],
+            historical_views=data["views"],
+            category=CATEGORY_REVERSE_MAP.get(data["category"], None),
+        )
+
+    def build_formats_from_scraped_data(self, directory, formats_json, asset):
+        done_thumbnail = False
+        for format_json in formats_json:
+            format = PolyFormat(
+                asset=asset,
+                format_type=format_json["formatType"],
+            )
+            self.formats.append(format)
+            if format_json.get("formatComplexity", None) is not None:
+                format_complexity_json = format_json["formatComplexity"]
+                format.triangle_count = format_complexity_json.get(
+                    "triangleCount", None
+                )
+                format.lod_hint = format_complexity_json.get("lodHint", None)
+
+            # Manually create thumbnails and assume that the files exist on B2
+            # in the right place.
+            if not done_thumbnail:
+                asset.thumbnail = f"poly/{directory}/thumbnail.png"
+                asset.thumbnail_contenttype = "image/png"
+                done_thumbnail = True
+            root_resource_json = format_json["root"]
+
+            file_path = root_resource_json["relativePath"]
+            extension = os.path.splitext(file_path)[-1].lower()
+
+            root_resource = PolyResource(
+                file=f"poly/{directory}/{file_path}",
+                is_root=True,
+                format=format,
+                asset=asset,
+                contenttype=root_resource_json["contentType"],
+            )
+            self.resources.append(root_resource)
+
+            format.role = EXTENSION_ROLE_MAP.get(extension)
+
+            if PROCESS_VIA_JSON_OVERRIDES:
+                # Override the Format's type if we find a special case.
+                # Note: This code will over-match and set all GLTFs to GLTF2
+                # given the right pathological data. However in the case of
+                # the polygone scrape, we know that for each root resource,
+                # there is only one file with the name {file_path} and so this
+                # is ok to blindly set it to GLTF2.
+                gltf_override_key = f"{directory}\\{file_path}"
+                if self.gltf2_data.get(gltf_override_key, False):
+                    format.format_type = "GLTF2"
+
+            if PROCESS_VIA_GLTF_PARSING and extension == ".gltf":
+                # Don't trust the format_type we got from the json. Instead,
+                # parse the gltf once it's saved to work out if it's version 1
+                # or 2.
+                self.gltf_roots.append(root_resource)
+
+            if format_json.get("resources", None) is not None:
+                for resource_json in format_json["resources"]:
+                    file_path = resource_json["relativePath"]
+                    self.resources.append(
+                        PolyResource(
+                            file=f"poly/{directory}/{file_path}",
+                            is_root=False,
+                            format=format,
+                            asset=asset,
+                            contenttype=resource_json["contentType"],
+                        )
+                    )
+
+    def build_formats_from_archive_data(self, formats_json, asset):
+        for format_json in formats_json:
+            format = PolyFormat(
+                asset=asset,
+                format_type=format_json["formatType"],
+            )
+            self.formats.append(format)
+
+            if format_json.get("formatComplexity", None) is not None:
+                format_complexity_json = format_json["formatComplexity"]
+                format.triangle_count = format_complexity_json.get(
+                    "triangleCount", None
+                )
+                format.lod_hint = format_complexity_json.get("lodHint", None)
+
+            # TODO(james): we need to either download the thumbnail from
+            # archive.org and store it ourselves or add another field for
+            # external thumbnail which references the external image.
+            root_resource_json = format_json["root"]
+            url = root_resource_json["url"]
+            self.resources.append(
+                PolyResource(
+                    external_url=f"https://web.archive.org/web/{url}",
+                    is_root=True,
+                    format=format,
+                    asset=asset,
+                    contenttype=get_content_type(url),
+                )
+            )
+
+            format.role = FORMAT_ROLE_MAP[root_resource_json["role"]]
+
+            if format_json.get("resources", None) is not None:
+                for resource_json in format_json["resources"]:
+                    url = resource_json["url"]
+                    self.resources.append(
+                        PolyResource(
+                            external_url=f"https://web.archive.org/web/{url}",
+                            is_root=False,
+                            format=format,
+                            asset=asset,
+                            contenttype=get_content_type(url),
+                        )
+                    )
+                # If a format has many files associated with it (i.e. it has a
+                # `resources` key), then we want to grab the archive url if we
+                # have it so we can provide this in the download options for
+                # the user.
+                if format_json.get("archive", None):
+                    format.archive_url = format_json["archive"]["url"]
+
+    @transaction.atomic
+    def import_chunk(self, chunk):
+        """Imports a chunk of parsed json lines, returning the number of
+        assets created. Assets which already exist are skipped."""
+        records = self.get_records(chunk)
+        existing = set(
+            Asset.objects.filter(url__in=records.keys()).values_list("url", flat=True)
+        )
+        records = {
+            asset_id: record
+            for asset_id, record in records.items()
+            if asset_id not in existing
+        }
+        if not records:
+            return 0
+
+        owners = self.get_owners(records)
+        tag_ids = self.get_tag_ids(
+            {
+                tag
+                for archive_data, scrape_data, _ in records.values()
+                for tag in archive_data["tags"] + scrape_data["tags"]
+            }
+        )
+
+        assets = []
+        asset_tags = []
+        self.formats = []
+        self.resources = []
+        self.gltf_roots = []
+        for asset_id, (archive_data, scrape_data, scrape_formats) in records.items():
+            asset = self.build_asset(
+                asset_id,
+                archive_data,
+                owners[archive_data["authorId"]],
+                "curated" in scrape_data.get("tags", []),
+            )
+            assets.append(asset)
+            for tag in set(archive_data["tags"] + scrape_data["tags"]):
+                asset_tags.append(
+                    Asset.tags.through(asset_id=asset.id, tag_id=tag_ids[tag])
+                )
+            if not IGNORE_SCRAPED_DATA:
+                # Create formats from the scraped data. These will be our
+                # primary formats to use for the viewer, initially.
+                self.build_formats_from_scraped_data(asset_id, scrape_formats, asset)
+            # Create formats from the archive data, for posterity.
+            self.build_formats_from_archive_data(archive_data["formats"], asset)
+
+        Asset.objects.bulk_create(assets)
+        Asset.tags.through.objects.bulk_create(asset_tags)
+        PolyFormat.objects.bulk_create(self.formats)
+        PolyResource.objects.bulk_create(self.resources)
+
+        if self.gltf_roots:
+            formats = []
+            for root_resource in self.gltf_roots:
+                format = root_resource.format
+                if is_gltf2(root_resource.file.file):
+                    format.format_type = "GLTF2"
+                else:
+                    format.format_type = "GLTF"
+                formats.append(format)
+            PolyFormat.objects.bulk_update(formats, ["format_type"])
+
+        return len(assets)
+
+
 class Command(BaseCommand):
 
     help = "Imports poly json files from a local directory"
@@ -291,6 +689,23 @@ class Command(BaseCommand):
             action="store_true",
             help="Download data files from B2",
         )
+        parser.add_argument(
+            "--download-from",
+            help="Download from a local directory laid out like the B2 bucket instead",
+        )
+        parser.add_argument(
+            "--download-workers",
+            type=int,
+            default=DEFAULT_DOWNLOAD_WORKERS,
+            help=f"Number of concurrent downloads (default {DEFAULT_DOWNLOAD_WORKERS})",
+        )
+        parser.add_argument(
+            "--store",
+            choices=list(STORES.keys()),
+            default="dirs",
+            help="How the data files are kept locally: a directory per asset, "
+            "or packed into one JSONL or SQLite file (default dirs)",
+        )
         parser.add_argument(
             "--ids",
             nargs="*",
@@ -298,11 +713,45 @@ class Command(BaseCommand):
             default=[],
             type=str,
         )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f"Number of lines to import per query (default {DEFAULT_CHUNK_SIZE})",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Number of processes to parse json with (default: parse inline)",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=CHECKPOINT_FILE,
+            help="File recording how far the import has got, so that it can resume",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint and start from the first line",
+        )
 
     def handle(self, *args, **options):
 
+        store = STORES[options["store"]]()
+
         if options["download"]:
-            get_json_from_b2(ASSETS_JSON_DIR)
+            if options["download_from"]:
+                source = LocalSource(options["download_from"])
+            else:
+                source = B2Source()
+            Path(POLY_JSON_DIR).mkdir(parents=True, exist_ok=True)
+            download_json(
+                source,
+                store,
+                options["download_workers"],
+                MANIFEST_FILE.format(store=options["store"]),
+            )
             print(
                 "Finished downloading. Run this command again \
                 without --download to process the files"
@@ -312,117 +761,42 @@ class Command(BaseCommand):
         if options["ids"]:
             directories = set(list(options["ids"]))
         else:
-            directories = set(os.listdir(ASSETS_JSON_DIR))
+            directories = set(store.ids())
 
-        print("Importing...", end="\r")
         with open(os.path.join(POLY_JSON_DIR, "gltf2.json")) as g:
             gltf2_data = json.load(g)
-            # Loop through all entries in the big jsonl.
-            #
-            # If we find a matching entry in the poly scrape directory, create
-            # an asset from the formats we find in there, then proceed to
-            # create formats from the jsonl data.
-
-            with open("./all_data.jsonl", "r") as json_file:
-                for line in json_file:
-                    archive_data = json.loads(line)
-                    asset_id = archive_data["assetId"]
-                    print(
-                        f"Importing {asset_id}                 ",
-                        end="\r",
-                    )
-
-                    if IGNORE_SCRAPED_DATA:
-                        if asset_id in directories:
-                            continue
-                    else:
-                        # Skip importing if the asset is not in the scraped
-                        # json.
-                        if asset_id not in directories:
-                            continue
-
-                    if IGNORE_SCRAPED_DATA:
-                        # Create empty, dummy scrape data.
-                        scrape_data = {
-                            "tags": [],
-                        }
-                        scrape_formats = []
-                        handle_asset(
-                            asset_id,
-                            archive_data,
-                            scrape_data,
-                            scrape_formats,
-                            gltf2_data,
-                        )
-
-                    else:
-                        # Create a new Asset object with the data.
-                        full_path = os.path.join(
-                            ASSETS_JSON_DIR, asset_id, "data.json"
-                        )
-                        with open(full_path) as f:
-                            scrape_data = json.load(f)
-                            scrape_formats = dedup_scrape_formats(
-                                scrape_data["formats"], asset_id
-                            )
-                        handle_asset(
-                            asset_id,
-                            archive_data,
-                            scrape_data,
-                            scrape_formats,
-                            gltf2_data,
-                        )
-
-        print("Finished                                  ")
-
-
-def handle_asset(
-    asset_id,
-    archive_data,
-    scrape_data,
-    scrape_formats,
-    gltf2_data,
-):
-    is_valid = False
-    for format in archive_data["formats"]:
-        if format["formatType"] in VALID_TYPES:
-            is_valid = True
-            break
-    if is_valid:
-        asset, asset_created = get_or_create_asset(
-            asset_id,
-            archive_data,
-            "curated" in scrape_data.get("tags", []),
-        )
-        if asset_created:
-            tag_set = set(archive_data["tags"] + scrape_data["tags"])
-            icosa_tags = []
-            for tag in tag_set:
-                obj, _ = Tag.objects.get_or_create(name=tag)
-                icosa_tags.append(obj)
-            asset.tags.set(list(icosa_tags))
-
-            if not IGNORE_SCRAPED_DATA:
-                # Create formats from the scraped data. These will
-                # be our primary formats to use for the viewer,
-                # initially.
-                create_formats_from_scraped_data(
-                    asset_id,
-                    gltf2_data,
-                    scrape_formats,
-                    asset,
+        importer = BulkImporter(directories, store, gltf2_data)
+
+        checkpoint = options["checkpoint"]
+        offset = 0 if options["restart"] else read_checkpoint(checkpoint)
+        size = os.path.getsize(ALL_DATA_FILE)
+        if offset:
+            print(f"Resuming from byte {offset} of {size}")
+
+        # Loop through all entries in the big jsonl.
+        #
+        # If we find a matching entry in the poly scrape directory, create an
+        # asset from the formats we find in there, then proceed to create
+        # formats from the jsonl data.
+        start = time.monotonic()
+        lines = 0
+        created = 0
+        with open(ALL_DATA_FILE, "rb") as json_file:
+            json_file.seek(offset)
+            chunks = read_chunks(json_file, options["chunk_size"])
+            for chunk, offset in parse_chunks(chunks, options["workers"]):
+                created += importer.import_chunk(chunk)
+                write_checkpoint(checkpoint, offset)
+                lines += len(chunk)
+                elapsed = time.monotonic() - start
+                print(
+                    f"{offset / size:.1%} | {lines} lines, {created} assets "
+                    f"| {lines / elapsed:.0f} lines/s, {created / elapsed:.0f} assets/s"
                 )
 
-            # Create formats from the archive data, for
-            # posterity.
-            create_formats_from_archive_data(
-                archive_data["formats"],
-                asset,
-            )
+        store.close()
 
-            # Re-save the asset to trigger model
-            # validation.
-            asset.save()
-    else:
-        with open("./invalid_assets.log", "a") as log:
-            log.write(f"{asset_id}\n")
+        print("Recomputing denorms...")
+        call_command("recompute_denorms", imported_from=IMPORT_SOURCE)
+        bump_generations(ASSET_LIST_GENERATION)
+        print("Finished")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+INDEX_USAGE_SQL = """
+SELECT
+    s.relname,
+    s.indexrelname,
+    s.idx_scan,
+    s.idx_tup_read,
+    s.idx_tup_fetch,
+    pg_relation_size(s.indexrelid)
+FROM pg_stat_user_indexes s
+WHERE s.relname = ANY(%s)
+ORDER BY s.relname, s.idx_scan DESC, s.indexrelname
+"""
+
+
+class Command(BaseCommand):
+
+    help = """Shows how often Postgres has used each index on the app's
+    tables since its statistics were last reset"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--table",
+            action="append",
+            help="Only show indexes on this table; can be repeated",
+        )
+        parser.add_argument(
+            "--unused",
+            action="store_true",
+            help="Only show indexes which have never been scanned",
+        )
+
+    def handle(self, *args, **options):
+        tables = options["table"]
+        if not tables:
+            tables = connection.introspection.django_table_names(only_existing=True)
+        with connection.cursor() as cursor:
+            cursor.execute(INDEX_USAGE_SQL, [tables])
+            rows = cursor.fetchall()
+        for table, index, scans, read, fetched, size in rows:
+            if options["unused"] and scans:
+                continue
+            print(
+                f"{table}.{index}: {scans} scans, {read} tuples read, "
+                f"{fetched} fetched, {size / 1024 / 1024:.1f}MB"
+            )
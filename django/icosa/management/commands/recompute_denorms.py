@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+from icosa.models import (
+    DENORM_FIELDS,
+    Asset,
+    PolyFormat,
+    PolyResource,
+    get_cors_allowed_sources,
+    get_format_type_counts,
+)
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+
+    help = """Recomputes every Asset's denormalised columns in batches. Run
+    this after bulk changes which bypass the denorm signal handlers."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f"Number of assets to process per query (default {DEFAULT_BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--imported-from",
+            help="Only process assets imported from this source",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        allowed_sources = get_cors_allowed_sources()
+        all_assets = Asset.objects.all()
+        if options["imported_from"]:
+            all_assets = all_assets.filter(imported_from=options["imported_from"])
+        total = all_assets.count()
+        done = 0
+        last_pk = None
+        while True:
+            assets = all_assets.order_by("pk")
+            if last_pk is not None:
+                assets = assets.filter(pk__gt=last_pk)
+            ids = list(assets.values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                break
+            self.process_batch(ids, allowed_sources)
+            last_pk = ids[-1]
+            done += len(ids)
+            print(f"Processed {done} of {total} assets")
+
+    @transaction.atomic
+    def process_batch(self, ids, allowed_sources):
+        counts = defaultdict(lambda: defaultdict(int))
+        for row in (
+            PolyFormat.objects.filter(asset_id__in=ids)
+            .values("asset_id")
+            .annotate(**get_format_type_counts())
+        ):
+            counts[row["asset_id"]].update(row)
+
+        triangle_counts = defaultdict(dict)
+        for asset_id, role, triangle_count in (
+            PolyFormat.objects.filter(asset_id__in=ids, triangle_count__gt=0)
+            .order_by("pk")
+            .values_list("asset_id", "role", "triangle_count")
+        ):
+            triangle_counts[asset_id].setdefault(role, triangle_count)
+
+        resources = defaultdict(list)
+        for asset_id, file, external_url in PolyResource.objects.filter(
+            asset_id__in=ids
+        ).values_list("asset_id", "file", "external_url"):
+            resources[asset_id].append((file, external_url))
+
+        assets = list(
+            Asset.objects.filter(pk__in=ids)
+            .select_related("owner")
+            .prefetch_related("tags")
+        )
+        for asset in assets:
+            asset.rank = asset.get_updated_rank()
+            asset.update_search_text()
+            asset.denorm_formats(
+                counts=counts[asset.pk],
+                triangle_counts=triangle_counts[asset.pk],
+                resources=resources[asset.pk],
+                allowed_sources=allowed_sources,
+            )
+        Asset.objects.bulk_update(assets, DENORM_FIELDS)
@@ -0,0 +1,45 @@
+import logging
+
+from icosa.helpers.queues import get_consumer_options, get_queue
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import autodiscover_modules
+from huey.consumer_options import ConsumerConfig
+
+
+class Command(BaseCommand):
+
+    help = """Runs the consumer for one of the named task queues in
+    settings.HUEY_QUEUES. Use `run_huey` for the default queue."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("queue", choices=list(settings.HUEY_QUEUES.keys()))
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help=(
+                "Override the number of workers for this queue. The uploads "
+                "queue relies on having only one"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        # Registers the tasks with their queues.
+        autodiscover_modules("tasks")
+
+        consumer_options = get_consumer_options(options["queue"])
+        if options["workers"] is not None:
+            consumer_options["workers"] = options["workers"]
+        config = ConsumerConfig(**consumer_options)
+        try:
+            config.validate()
+        except ValueError as err:
+            raise CommandError(err)
+
+        logger = logging.getLogger("huey")
+        if not logger.handlers:
+            config.setup_logger(logger)
+
+        consumer = get_queue(options["queue"]).create_consumer(**config.values)
+        consumer.run()
@@ -0,0 +1,27 @@
+from icosa.helpers.queues import get_payload_stats
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import autodiscover_modules
+
+
+class Command(BaseCommand):
+
+    help = """Shows the number and serialized size of tasks enqueued on the
+    named task queues"""
+
+    def handle(self, *args, **options):
+        if not settings.SHARED_CACHE:
+            print(
+                "Warning: the cache isn't shared between processes, so these "
+                "counts only cover this command's own process. Set "
+                "DJANGO_CACHE_REDIS_URL to share it."
+            )
+        # Registers the tasks, so that we know their names.
+        autodiscover_modules("tasks")
+        for task_name, stats in get_payload_stats().items():
+            average = stats["bytes"] / stats["count"] if stats["count"] else 0
+            print(
+                f"{task_name}: {stats['count']} enqueued, "
+                f"average {average:.0f} bytes, max {stats['max_bytes']} bytes"
+            )
@@ -0,0 +1,21 @@
+from icosa.helpers.rank import update_ranks
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+
+    help = """Recomputes rank for all public assets."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.RANK_UPDATE_BATCH_SIZE,
+            help="Number of assets to update per statement, or 0 for all at once",
+        )
+
+    def handle(self, *args, **options):
+        log = update_ranks(options["batch_size"])
+        print(f"Updated {log.asset_count} assets in {log.duration:.2f}s")
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Mirrors Asset.update_search_text, so that existing assets are searchable
+# without having to re-save each one.
+POPULATE_SEARCH_VECTOR_SQL = """
+UPDATE assets a SET search_vector =
+    setweight(to_tsvector('english', coalesce(a.name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(t.name, ' ')
+        FROM assets_tags at JOIN icosa_tag t ON t.id = at.tag_id
+        WHERE at.asset_id = a.id
+    ), '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(a.description, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce((
+        SELECT u.displayname FROM users u WHERE u.id = a.owner_id
+    ), '')), 'D');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('icosa', '0092_assetowner_merged_with_alter_assetowner_django_user'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='asset',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(POPULATE_SEARCH_VECTOR_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='asset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='assets_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_text'], name='assets_search_text_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
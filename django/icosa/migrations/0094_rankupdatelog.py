@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('icosa', '0093_asset_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankUpdateLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('duration', models.FloatField(help_text='Seconds')),
+                ('asset_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('icosa', '0094_rankupdatelog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='asset',
+            name='state',
+            field=models.CharField(choices=[('BARE', 'Bare'), ('UPLOADING', 'Uploading'), ('COMPLETE', 'Complete'), ('FAILED', 'Failed'), ('DELETING', 'Deleting'), ('DELETE_FAILED', 'Delete failed')], db_default='BARE', default='BARE', max_length=255),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:00
+
+from django.db import migrations
+
+# The m2m table's unique index leads with asset_id. This is its mirror, so
+# that tag filters can start from the matching tags and find their assets
+# with an index-only scan. See `filter_tags` in icosa.api.filters.
+CREATE_TAG_ASSET_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS assets_tags_tag_id_asset_id_idx
+    ON assets_tags (tag_id, asset_id);
+"""
+
+DROP_TAG_ASSET_INDEX_SQL = """
+DROP INDEX IF EXISTS assets_tags_tag_id_asset_id_idx;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('icosa', '0095_alter_asset_state'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TAG_ASSET_INDEX_SQL, DROP_TAG_ASSET_INDEX_SQL),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Builds the indexes without locking writes to assets.
+    atomic = False
+
+    dependencies = [
+        ('icosa', '0096_assets_tags_tag_asset_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='asset',
+            index=models.Index(condition=models.Q(('last_reported_time__isnull', True), ('license__isnull', False), ('visibility', 'PUBLIC'), models.Q(('license', 'ALL_RIGHTS_RESERVED'), _negated=True)), fields=['-rank', '-id'], name='assets_listed_rank_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='asset',
+            index=models.Index(condition=models.Q(('last_reported_time__isnull', True), ('license__isnull', False), ('visibility', 'PUBLIC'), models.Q(('license', 'ALL_RIGHTS_RESERVED'), _negated=True)), fields=['-create_time', '-id'], name='assets_listed_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='asset',
+            index=models.Index(condition=models.Q(('last_reported_time__isnull', True), ('license__isnull', False), ('visibility', 'PUBLIC'), models.Q(('license', 'ALL_RIGHTS_RESERVED'), _negated=True)), fields=['-triangle_count', '-id'], name='assets_listed_triangles_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='asset',
+            index=models.Index(condition=models.Q(('last_reported_time__isnull', True), ('license__isnull', False), ('visibility', 'PUBLIC'), models.Q(('license', 'ALL_RIGHTS_RESERVED'), _negated=True)), fields=['category', '-rank', '-id'], name='assets_listed_cat_rank_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='asset',
+            index=models.Index(condition=models.Q(('last_reported_time__isnull', True), ('license__isnull', False), ('visibility', 'PUBLIC'), models.Q(('license', 'ALL_RIGHTS_RESERVED'), _negated=True), ('curated', True)), fields=['-rank', '-id'], name='assets_listed_curated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='asset',
+            index=models.Index(fields=['url'], name='assets_url_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='asset',
+            index=models.Index(fields=['owner', 'url'], name='assets_owner_url_idx'),
+        ),
+    ]
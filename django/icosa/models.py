@@ -11,9 +11,16 @@ from b2sdk._internal.exception import FileNotHidden, FileNotPresent
 from constance import config
 from django.conf import settings
 from django.contrib.auth.models import User as DjangoUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Prefetch, Q, Value
+from django.db.models.functions import Extract
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 from django.utils.text import slugify
 from icosa.helpers.format_roles import (
@@ -33,14 +40,32 @@ from icosa.helpers.format_roles import (
     USDZ_FORMAT,
 )
 
+from .helpers.cache import bump_asset_generations
+from .helpers.search import SEARCH_CONFIG
 from .helpers.snowflake import get_snowflake_timestamp
-from .helpers.storage import get_b2_bucket
+from .helpers.storage import HideFilesError, get_storage_client
 
 FILENAME_MAX_LENGTH = 1024
 
-LIKES_WEIGHT = 100
-VIEWS_WEIGHT = 0.1
-RECENCY_WEIGHT = 1
+LIKES_WEIGHT = settings.RANK_LIKES_WEIGHT
+VIEWS_WEIGHT = settings.RANK_VIEWS_WEIGHT
+RECENCY_WEIGHT = settings.RANK_RECENCY_WEIGHT
+
+
+def get_rank_expression(views=None, now=None):
+    """The SQL equivalent of Asset.get_updated_rank. Pass `views` to rank with
+    a view count other than the one currently stored."""
+    if views is None:
+        views = F("views")
+    if now is None:
+        now = datetime.now()
+    age = Value(now.timestamp()) - Extract("create_time", "epoch")
+    return ExpressionWrapper(
+        (F("likes") + F("historical_likes") + 1) * LIKES_WEIGHT
+        + (views + F("historical_views")) * VIEWS_WEIGHT
+        + Value(RECENCY_WEIGHT) / age,
+        output_field=FloatField(),
+    )
 
 PUBLIC = "PUBLIC"
 PRIVATE = "PRIVATE"
@@ -199,16 +224,119 @@ VIEWABLE_FORMAT_TYPES = [
     "OBJ",
 ]
 
+# Asset's denormalised columns, grouped by what they are derived from. A
+# plain `Asset.save()` only writes the columns whose inputs have changed; see
+# `Asset.update_denorms`.
+RANK_INPUT_FIELDS = [
+    "likes",
+    "historical_likes",
+    "views",
+    "historical_views",
+]
+SEARCH_INPUT_FIELDS = [
+    "name",
+    "description",
+    "owner_id",
+]
+RANK_DENORM_FIELDS = [
+    "rank",
+]
+SEARCH_DENORM_FIELDS = [
+    "search_text",
+    "search_vector",
+]
+FORMAT_DENORM_FIELDS = [
+    "is_viewer_compatible",
+    "has_tilt",
+    "has_blocks",
+    "has_gltf1",
+    "has_gltf2",
+    "has_gltf_any",
+    "has_fbx",
+    "has_obj",
+    "triangle_count",
+]
+DENORM_FIELDS = RANK_DENORM_FIELDS + SEARCH_DENORM_FIELDS + FORMAT_DENORM_FIELDS
+
+# Large columns which asset listings never show; `polydata` alone holds the
+# whole original Poly record. Detail views still load them.
+LISTING_DEFERRED_FIELDS = [
+    "formats",
+    "polydata",
+    "transform",
+    "camera",
+    "presentation_params",
+    "remix_ids",
+] + SEARCH_DENORM_FIELDS
+
+# Public assets which may be shown in listings: openly licensed and not
+# reported. The listing indexes on Asset are partial on this, so queries must
+# use it as is for Postgres to match them.
+LISTED_Q = Q(
+    visibility=PUBLIC,
+    license__isnull=False,
+    last_reported_time__isnull=True,
+) & ~Q(license=ALL_RIGHTS_RESERVED)
+
+FORMAT_TYPE_FLAGS = {
+    "has_tilt": ["TILT"],
+    "has_blocks": ["BLOCKS"],
+    "has_gltf1": ["GLTF"],
+    "has_gltf2": ["GLTF2"],
+    "has_gltf_any": ["GLTF", "GLTF2"],
+    "has_fbx": ["FBX"],
+    "has_obj": ["OBJ"],
+}
+
+
+def get_format_type_counts():
+    """Aggregates over PolyFormat which count, per FORMAT_TYPE_FLAGS entry,
+    the formats of that type, plus the number of viewable formats."""
+    counts = {
+        flag: Count("pk", filter=Q(format_type__in=format_types))
+        for flag, format_types in FORMAT_TYPE_FLAGS.items()
+    }
+    counts["viewable"] = Count("pk", filter=Q(format_type__in=VIEWABLE_FORMAT_TYPES))
+    return counts
+
+
+def get_cors_allowed_sources():
+    if config.EXTERNAL_MEDIA_CORS_ALLOW_LIST:
+        return tuple(
+            [x.strip() for x in config.EXTERNAL_MEDIA_CORS_ALLOW_LIST.split(",")]
+        )
+    return tuple([])
+
+
+def is_cors_allowed(resources, allowed_sources=None) -> bool:
+    """Takes (file, external_url) pairs for an asset's resources."""
+    if allowed_sources is None:
+        allowed_sources = get_cors_allowed_sources()
+    for file, external_url in resources:
+        # If this resource has a file managed by Django storage, then it will
+        # be viewable.
+        if file is not None:
+            return True
+        # Otherwise, check if the externally-hosted file's source has been
+        # allowed by the site admin in django constance settings.
+        if external_url is not None and external_url.startswith(allowed_sources):
+            return True
+    return False
+
 
 ASSET_STATE_BARE = "BARE"
 ASSET_STATE_UPLOADING = "UPLOADING"
 ASSET_STATE_COMPLETE = "COMPLETE"
 ASSET_STATE_FAILED = "FAILED"
+ASSET_STATE_DELETING = "DELETING"
+ASSET_STATE_DELETE_FAILED = "DELETE_FAILED"
 ASSET_STATE_CHOICES = [
     (ASSET_STATE_BARE, "Bare"),
     (ASSET_STATE_UPLOADING, "Uploading"),
     (ASSET_STATE_COMPLETE, "Complete"),
     (ASSET_STATE_FAILED, "Failed"),
+    (ASSET_STATE_DELETING, "Deleting"),
+    (ASSET_STATE_DELETE_FAILED, "Delete failed"),
 ]
 
 
@@ -245,6 +373,13 @@ class AssetOwner(models.Model):
         on_delete=models.SET_NULL,
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets `owner_changed` tell whether a save renamed the owner.
+        instance._loaded_displayname = instance.__dict__.get("displayname")
+        return instance
+
     @classmethod
     def from_ninja_request(cls, request):
         instance = None
@@ -442,6 +577,7 @@ class Asset(models.Model):
     # Denorm fields
     triangle_count = models.PositiveIntegerField(default=0)
     search_text = models.TextField(null=True, blank=True)
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
     is_viewer_compatible = models.BooleanField(default=False)
 
     has_tilt = models.BooleanField(default=False)
@@ -462,7 +598,7 @@ class Asset(models.Model):
     def timestamp(self):
         return get_snowflake_timestamp(self.id)
 
-    @property
+    @cached_property
     def _preferred_viewer_format(self):
         # Return early with an obj if we know the asset is a blocks file.
         # There are some issues with displaying GLTF files from Blocks so we
@@ -488,62 +624,50 @@ class Asset(models.Model):
                     "resource": obj_resource,
                 }
 
-        # Return early if we can grab a Polygone resource first
-        polygone_gltf = self.polyresource_set.filter(
-            is_root=True, format__role__in=[1002, 1003]
-        ).first()
-        if polygone_gltf:
-            return {
-                "format": polygone_gltf.format.format_type,
-                "url": polygone_gltf.internal_url_or_none,
-                "resource": polygone_gltf,
-            }
-
-        # Return early with either of the role-based formats we care about.
-        updated_gltf = self.polyresource_set.filter(
-            is_root=True, format__role=30
-        ).first()
-        if updated_gltf:
-            return {
-                "format": updated_gltf.format.format_type,
-                "url": updated_gltf.internal_url_or_none,
-                "resource": updated_gltf,
-            }
-
-        original_gltf = self.polyresource_set.filter(
-            is_root=True, format__role=12
-        ).first()
-        if original_gltf:
-            return {
-                "format": original_gltf.format.format_type,
-                "url": original_gltf.internal_url_or_none,
-                "resource": original_gltf,
-            }
+        roots = self.get_root_resources()
+
+        # Return early with a Polygone resource, or else either of the
+        # role-based formats we care about.
+        for roles in [[1002, 1003], [30], [12]]:
+            for root in roots:
+                if root.format.role in roles:
+                    return viewer_format_for(root)
 
         # If we didn't get any role-based formats, find the remaining formats
-        # we care about and choose the "best" one of those.
+        # we care about and choose the "best" one of those. Roots are ordered
+        # by format, so later formats of a type win as before.
         formats = {}
-        for format in self.polyformat_set.all():
-            root = format.root_resource
-            formats[format.format_type] = {
-                "format": format.format_type,
-                "url": root.internal_url_or_none,
-                "resource": root,
-            }
-        # GLB is our primary preferred format;
-        if "GLB" in formats.keys():
-            return formats["GLB"]
-        # GLTF2 is the next best option;
-        if "GLTF2" in formats.keys():
-            return formats["GLTF2"]
-        # GLTF1, if we must.
-        if "GLTF" in formats.keys():
-            return formats["GLTF"]
-        # Last chance, OBJ
-        if "OBJ" in formats.keys():
-            return formats["OBJ"]
+        seen_formats = set()
+        for root in sorted(roots, key=lambda root: (root.format_id, root.pk)):
+            if root.format_id in seen_formats:
+                continue
+            seen_formats.add(root.format_id)
+            formats[root.format.format_type] = viewer_format_for(root)
+        # GLB is our primary preferred format, then GLTF2, GLTF1 if we must
+        # and, as a last chance, OBJ.
+        for format_type in ["GLB", "GLTF2", "GLTF", "OBJ"]:
+            if format_type in formats:
+                return formats[format_type]
         return None
 
+    def get_root_resources(self):
+        """The asset's root resources with their formats, in id order. Loaded
+        by one query, unless already prefetched with `root_resources_prefetch`.
+        """
+        if not hasattr(self, "root_resources"):
+            self.root_resources = list(
+                self.polyresource_set.filter(is_root=True)
+                .select_related("format")
+                .order_by("pk")
+            )
+        return self.root_resources
+
+    def clear_root_resources(self):
+        """Forgets the root resources and the viewer format chosen from them,
+        for when the asset's formats change."""
+        self.__dict__.pop("root_resources", None)
+        self.__dict__.pop("_preferred_viewer_format", None)
+
     @property
     def preferred_viewer_format(self):
         format = self._preferred_viewer_format
@@ -562,46 +686,18 @@ class Asset(models.Model):
 
     @property
     def has_cors_allowed(self):
-        # If this resource has a file managed by Django storage, then it will
-        # be viewable.
-        if (
-            self.polyresource_set.filter(
-                file__isnull=False,
-            ).count()
-            > 0
-        ):
-            return True
-
-        # If any resource does not have a file managed by Django storage, check
-        # if any of the externally-hosted files' sources have been allowed by
-        # the site admin in django constance settings.
-        if config.EXTERNAL_MEDIA_CORS_ALLOW_LIST:
-            allowed_sources = tuple(
-                [x.strip() for x in config.EXTERNAL_MEDIA_CORS_ALLOW_LIST.split(",")]
-            )
-        else:
-            allowed_sources = tuple([])
-
-        return (
-            len(
-                [
-                    x.external_url
-                    for x in self.polyresource_set.filter(
-                        external_url__isnull=False,
-                    )
-                    if x.external_url.startswith(allowed_sources)
-                ]
-            )
-            > 0
+        return is_cors_allowed(
+            self.polyresource_set.values_list("file", "external_url")
         )
 
     @property
     def download_url(self):
         if self.license == ALL_RIGHTS_RESERVED or not self.license:
             return None
-        updated_gltf = self.polyresource_set.filter(
-            is_root=True, format__role=30
-        ).first()
+        updated_gltf = next(
+            (root for root in self.get_root_resources() if root.format.role == 30),
+            None,
+        )
 
         preferred_format = self.preferred_viewer_format
 
@@ -675,6 +771,17 @@ class Asset(models.Model):
         self.search_text = (
             f"{self.name} {description} {tag_str} {self.owner.displayname}"
         )
+        # Built from values rather than columns because, within the UPDATE,
+        # columns would still hold their old values. Like any expression
+        # assigned to a field, this is only a real value after a refresh.
+        self.search_vector = (
+            SearchVector(Value(self.name or ""), weight="A", config=SEARCH_CONFIG)
+            + SearchVector(Value(tag_str), weight="B", config=SEARCH_CONFIG)
+            + SearchVector(Value(description), weight="C", config=SEARCH_CONFIG)
+            + SearchVector(
+                Value(self.owner.displayname), weight="D", config=SEARCH_CONFIG
+            )
+        )
 
     def calc_is_viewable(self):
         if not self.pk:
@@ -683,23 +790,43 @@ class Asset(models.Model):
             return True
         return False
 
-    def denorm_format_types(self):
+    def denorm_format_types(self, counts=None):
         if not self.pk:
             return
-        self.has_tilt = self.polyformat_set.filter(format_type="TILT").exists()
-        self.has_blocks = self.polyformat_set.filter(format_type="BLOCKS").exists()
-        self.has_gltf1 = self.polyformat_set.filter(format_type="GLTF").exists()
-        self.has_gltf2 = self.polyformat_set.filter(format_type="GLTF2").exists()
-        self.has_gltf_any = self.polyformat_set.filter(
-            format_type__in=["GLTF", "GLTF2"]
-        ).exists()
-        self.has_fbx = self.polyformat_set.filter(format_type="FBX").exists()
-        self.has_obj = self.polyformat_set.filter(format_type="OBJ").exists()
-
-    def get_triangle_count(self):
-        formats = {}
-        for format in self.polyformat_set.filter(triangle_count__gt=0):
-            formats.setdefault(format.role, format.triangle_count)
+        if counts is None:
+            counts = self.polyformat_set.aggregate(**get_format_type_counts())
+        for flag in FORMAT_TYPE_FLAGS.keys():
+            setattr(self, flag, counts[flag] > 0)
+
+    def denorm_formats(
+        self,
+        counts=None,
+        triangle_counts=None,
+        resources=None,
+        allowed_sources=None,
+    ):
+        """Recomputes every column derived from the asset's formats and
+        resources. The arguments allow callers working on many assets to
+        fetch these in bulk; see the `recompute_denorms` command."""
+        if not self.pk:
+            return
+        self.clear_root_resources()
+        if counts is None:
+            counts = self.polyformat_set.aggregate(**get_format_type_counts())
+        self.denorm_format_types(counts)
+        if counts["viewable"] > 0:
+            if resources is None:
+                resources = self.polyresource_set.values_list("file", "external_url")
+            self.is_viewer_compatible = is_cors_allowed(resources, allowed_sources)
+        else:
+            self.is_viewer_compatible = False
+        self.triangle_count = self.get_triangle_count(triangle_counts)
+
+    def get_triangle_count(self, formats=None):
+        if formats is None:
+            formats = {}
+            for format in self.polyformat_set.filter(triangle_count__gt=0):
+                formats.setdefault(format.role, format.triangle_count)
         if POLYGONE_GLTF_FORMAT in formats.keys():
             return formats[POLYGONE_GLTF_FORMAT]
         if ORIGINAL_TRIANGULATED_OBJ_FORMAT in formats.keys():
@@ -731,11 +858,6 @@ class Asset(models.Model):
         ) * RECENCY_WEIGHT
         return rank
 
-    def inc_views_and_rank(self):
-        self.views += 1
-        self.rank = self.get_updated_rank()
-        self.save()
-
     def get_all_file_names(self):
         file_list = []
         if self.thumbnail:
@@ -776,15 +898,25 @@ class Asset(models.Model):
             "Updated glTF File": "GLTF File",
         }
 
-        for format in self.polyformat_set.filter(role__in=WEB_UI_DOWNLOAD_COMPATIBLE):
+        # Fetch all resources which have either an external url or a file,
+        # for every format at once.
+        query = Q(external_url__isnull=False) & ~Q(external_url="")
+        query |= Q(file__isnull=False)
+        downloadable_formats = self.polyformat_set.filter(
+            role__in=WEB_UI_DOWNLOAD_COMPATIBLE
+        ).prefetch_related(
+            Prefetch(
+                "polyresource_set",
+                queryset=PolyResource.objects.filter(query).order_by("pk"),
+                to_attr="downloadable_resources",
+            )
+        )
+
+        for format in downloadable_formats:
             if format.archive_url:
                 resource_data = {"archive_url": f"{ARCHIVE_PREFIX}{format.archive_url}"}
             else:
-                # Query all resources which have either an external url or a
-                # file.
-                query = Q(external_url__isnull=False) & ~Q(external_url="")
-                query |= Q(file__isnull=False)
-                resources = format.polyresource_set.filter(query)
+                resources = format.downloadable_resources
                 if format.role == POLYGONE_GLTF_FORMAT:
                     resource_data = {
                         "files_to_zip": [
@@ -834,7 +966,7 @@ class Asset(models.Model):
                     # we can resolve this.
                     continue
                 else:
-                    resource = resources.first()
+                    resource = next(iter(resources), None)
                     if resource.file:
                         storage = settings.DJANGO_STORAGE_URL
                         bucket = settings.DJANGO_STORAGE_BUCKET_NAME
@@ -852,42 +984,115 @@ class Asset(models.Model):
             formats.setdefault(format_name, resource_data)
         return OrderedDict(sorted(formats.items(), key=lambda x: x[0].lower()))
 
+    def mark_for_deletion(self):
+        """Takes the asset out of view straight away. The `queue_delete_asset`
+        task then hides its media and deletes it."""
+        self.state = ASSET_STATE_DELETING
+        self.visibility = PRIVATE
+        self.save(update_fields=["state", "visibility"])
+
     def hide_media(self):
         """For B2, at least, call `hide` on each item from
         self.get_all_files() then delete the model instance and all its related
         models. For the moment, this should not be part of Asset's delete
-        method, for safety."""
+        method, for safety.
+
+        Files hidden by an earlier call are skipped, so this can be retried
+        after a partial failure. Raises HideFilesError if any file couldn't be
+        hidden."""
 
         hidden_files = []
         file_names = self.get_all_file_names()
         if len(file_names) == 0:
             return hidden_files
+        already_hidden = set(
+            HiddenMediaFileLog.objects.filter(original_asset_id=self.pk).values_list(
+                "file_name", flat=True
+            )
+        )
 
-        bucket = get_b2_bucket()
+        to_hide = []
         for file_name in file_names:
             if file_name.startswith("poly/"):
                 # This is a poly file and we might not want to delete/hide it.
                 pass  # TODO
+            elif file_name in already_hidden:
+                pass
             elif file_name.startswith("icosa/"):
                 # This is a user file, so we are ok to delete/hide it.
-                bucket.hide_file(file_name)
-                HiddenMediaFileLog.objects.create(
-                    original_asset_id=self.pk,
-                    file_name=file_name,
-                )
+                to_hide.append(file_name)
             else:
                 # This is not a file we care to mess with.
                 pass
 
-    def save(self, *args, **kwargs):
-        if self._state.adding is False:
-            # Only denorm fields when updating an existing model
+        hidden_files, failed = get_storage_client().hide_files(to_hide)
+        HiddenMediaFileLog.objects.bulk_create(
+            [
+                HiddenMediaFileLog(original_asset_id=self.pk, file_name=file_name)
+                for file_name in hidden_files
+            ]
+        )
+        if failed:
+            raise HideFilesError(failed)
+        return hidden_files
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_denorm_inputs()
+        return instance
+
+    def snapshot_denorm_inputs(self):
+        # Deferred fields are left out, and so are never considered changed.
+        self._denorm_inputs = {
+            field: self.__dict__[field]
+            for field in RANK_INPUT_FIELDS + SEARCH_INPUT_FIELDS
+            if field in self.__dict__
+        }
+
+    def get_changed_denorm_inputs(self):
+        loaded = getattr(self, "_denorm_inputs", {})
+        return {
+            field
+            for field, value in loaded.items()
+            if self.__dict__.get(field, value) != value
+        }
+
+    def update_denorms(self):
+        """Recomputes the denormalised columns whose inputs on this model have
+        changed since it was loaded, and returns their names.
+
+        Columns derived from formats, resources and tags are kept up to date
+        by signal handlers as those change, so are not recomputed here.
+        """
+        changed = self.get_changed_denorm_inputs()
+        fields = []
+        if changed.intersection(RANK_INPUT_FIELDS):
             self.rank = self.get_updated_rank()
+            fields += RANK_DENORM_FIELDS
+        if changed.intersection(SEARCH_INPUT_FIELDS):
             self.update_search_text()
-            self.is_viewer_compatible = self.calc_is_viewable()
-            self.denorm_format_types()
-            self.denorm_triangle_count()
+            fields += SEARCH_DENORM_FIELDS
+        return fields
+
+    def save(self, *args, **kwargs):
+        if self._state.adding is False and kwargs.get("update_fields") is None:
+            # Only denorm fields when updating an existing model. Denorm
+            # fields we haven't recomputed are left out of the update, so that
+            # a stale in-memory value can't overwrite one written by a signal
+            # handler since this instance was loaded. Deferred fields are left
+            # out too, as Django would.
+            denorm_fields = self.update_denorms()
+            deferred_fields = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred_fields
+                and (field.name not in DENORM_FIELDS or field.name in denorm_fields)
+            ]
         super().save(*args, **kwargs)
+        self.snapshot_denorm_inputs()
 
     class Meta:
         db_table = "assets"
@@ -897,7 +1102,52 @@ class Asset(models.Model):
                     "is_viewer_compatible",
                     "visibility",
                 ]
-            )
+            ),
+            GinIndex(
+                fields=["search_vector"],
+                name="assets_search_vector_idx",
+            ),
+            GinIndex(
+                fields=["search_text"],
+                name="assets_search_text_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            # One per listing order; see ORDERINGS in icosa.api.filters.
+            # OLDEST scans assets_listed_created_idx backwards.
+            models.Index(
+                fields=["-rank", "-id"],
+                name="assets_listed_rank_idx",
+                condition=LISTED_Q,
+            ),
+            models.Index(
+                fields=["-create_time", "-id"],
+                name="assets_listed_created_idx",
+                condition=LISTED_Q,
+            ),
+            models.Index(
+                fields=["-triangle_count", "-id"],
+                name="assets_listed_triangles_idx",
+                condition=LISTED_Q,
+            ),
+            # The landing pages.
+            models.Index(
+                fields=["category", "-rank", "-id"],
+                name="assets_listed_cat_rank_idx",
+                condition=LISTED_Q,
+            ),
+            models.Index(
+                fields=["-rank", "-id"],
+                name="assets_listed_curated_idx",
+                condition=LISTED_Q & Q(curated=True),
+            ),
+            models.Index(
+                fields=["url"],
+                name="assets_url_idx",
+            ),
+            models.Index(
+                fields=["owner", "url"],
+                name="assets_owner_url_idx",
+            ),
         ]
 
 
@@ -1088,15 +1338,23 @@ class Oauth2Token(models.Model):
         db_table = "oauth2_token"
 
 
+class RankUpdateLog(models.Model):
+    start_time = models.DateTimeField()
+    duration = models.FloatField(help_text="Seconds")
+    asset_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.start_time}: {self.asset_count} assets in {self.duration:.2f}s"
+
+
 class HiddenMediaFileLog(models.Model):
     original_asset_id = models.BigIntegerField()
     file_name = models.CharField(max_length=FILENAME_MAX_LENGTH)
     deleted_from_source = models.BooleanField(default=False)
 
     def unhide(self):
-        bucket = get_b2_bucket()
         try:
-            bucket.unhide_file(self.file_name)
+            get_storage_client().unhide_file(self.file_name)
         except FileNotPresent:
             print("File not present in storage, marking as deleted")
             self.deleted_from_source = True
@@ -1106,3 +1364,104 @@ class HiddenMediaFileLog(models.Model):
 
     def __str__(self):
         return f"{self.original_asset_id}: {self.file_name}"
+
+
+# Denormalisation signal handlers
+#
+# These keep Asset's derived columns up to date as their inputs on other
+# models change, writing only the affected columns. Bulk operations, such as
+# `bulk_create` and queryset `update`, don't send signals; run the
+# `recompute_denorms` command after those.
+
+
+def viewer_format_for(resource):
+    return {
+        "format": resource.format.format_type,
+        "url": resource.internal_url_or_none,
+        "resource": resource,
+    }
+
+
+def root_resources_prefetch():
+    """Prefetches `Asset.get_root_resources` for a page of assets in one
+    query."""
+    return Prefetch(
+        "polyresource_set",
+        queryset=PolyResource.objects.filter(is_root=True)
+        .select_related("format")
+        .order_by("pk"),
+        to_attr="root_resources",
+    )
+
+
+def update_format_denorms(asset_id, asset=None):
+    if asset is None:
+        asset = Asset(pk=asset_id)
+        asset.url = (
+            Asset.objects.filter(pk=asset_id).values_list("url", flat=True).first()
+        )
+    asset.denorm_formats()
+    Asset.objects.filter(pk=asset_id).update(
+        update_time=timezone.now(),
+        **{field: getattr(asset, field) for field in FORMAT_DENORM_FIELDS},
+    )
+    bump_asset_generations(asset.url)
+
+
+def update_search_denorms(asset):
+    asset.update_search_text()
+    Asset.objects.filter(pk=asset.pk).update(
+        update_time=timezone.now(),
+        **{field: getattr(asset, field) for field in SEARCH_DENORM_FIELDS},
+    )
+    bump_asset_generations(asset.url)
+
+
+@receiver([post_save, post_delete], sender=Asset)
+def asset_changed(sender, instance, **kwargs):
+    bump_asset_generations(instance.url)
+
+
+@receiver(post_save, sender=AssetOwner)
+def owner_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Asset responses include the owner's display name.
+    if created or "displayname" not in instance.__dict__:
+        return
+    if update_fields is not None and "displayname" not in update_fields:
+        return
+    if getattr(instance, "_loaded_displayname", None) == instance.displayname:
+        return
+    instance._loaded_displayname = instance.displayname
+    bump_asset_generations(*instance.asset_set.values_list("url", flat=True))
+
+
+@receiver([post_save, post_delete], sender=PolyFormat)
+@receiver([post_save, post_delete], sender=PolyResource)
+def polyformat_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Asset):
+        # The asset itself is being deleted.
+        return
+    if instance.asset_id is None:
+        return
+    asset = sender._meta.get_field("asset").get_cached_value(instance, default=None)
+    update_format_denorms(instance.asset_id, asset)
+
+
+@receiver(m2m_changed, sender=Asset.tags.through)
+def asset_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ["post_add", "post_remove", "post_clear"]:
+            update_search_denorms(instance)
+        return
+    # `instance` is a Tag.
+    if action == "pre_clear":
+        instance._cleared_asset_ids = list(
+            instance.asset_set.values_list("pk", flat=True)
+        )
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_asset_ids", [])
+    elif action not in ["post_add", "post_remove"]:
+        return
+    for asset in Asset.objects.filter(pk__in=pk_set).select_related("owner"):
+        update_search_denorms(asset)
@@ -1,24 +1,49 @@
 from typing import List, Optional
 
+from django.db import transaction
 from django.utils import timezone
-from huey import signals
-from huey.contrib.djhuey import db_task, on_commit_task, signal
+from huey import crontab, signals
+from huey.contrib.djhuey import db_periodic_task, on_commit_task, signal
 from icosa.api.schema import AssetFinalizeData
-from icosa.helpers.file import upload_asset, upload_format
-from icosa.models import ASSET_STATE_FAILED, Asset, AssetOwner, PolyFormat
-from ninja import File
-from ninja.files import UploadedFile
-
-
-@signal(signals.SIGNAL_ERROR)
+from icosa.helpers.file import (
+    StagedFile,
+    open_staged_files,
+    upload_asset,
+    upload_format,
+)
+from icosa.helpers.gltf_converter import get_converter_pool
+from icosa.helpers.queues import (
+    CONVERSIONS_QUEUE,
+    UPLOADS_QUEUE,
+    get_queue,
+    queue_on_commit_task,
+)
+from icosa.helpers.rank import update_ranks
+from icosa.helpers.view_counts import flush_view_counts
+from icosa.models import (
+    ASSET_STATE_DELETE_FAILED,
+    ASSET_STATE_FAILED,
+    Asset,
+    AssetOwner,
+    update_format_denorms,
+)
+
+
+@get_queue(CONVERSIONS_QUEUE).on_startup()
+def warm_converter_pool():
+    # Start the glTF converters now, rather than during the first upload.
+    get_converter_pool().warm()
+
+
+@get_queue(CONVERSIONS_QUEUE).signal(signals.SIGNAL_ERROR)
 def task_error(signal, task, exc):
     if task.name == "queue_upload_asset":
         handle_upload_error(task, exc)
 
 
 def handle_upload_error(task, exc):
-    asset = task.kwargs.pop("asset")
-    user = task.kwargs.pop("current_user")
+    asset = Asset.objects.get(pk=task.kwargs["asset_id"])
+    user = AssetOwner.objects.get(pk=task.kwargs["user_id"])
 
     asset.state = ASSET_STATE_FAILED
     asset.save()
@@ -28,59 +53,105 @@ def handle_upload_error(task, exc):
     # will the user dismiss the error, or will we dismiss it after it has been
     # viewed? How do we know it's been read?
     with open("huey_task_error.log", "a") as logfile:
-        logfile.write(f"{timezone.now()} {asset.id} {user.id} {user.displayname}\n")
+        logfile.write(
+            f"{timezone.now()} {asset.id} {user.id} {user.displayname} {exc}\n"
+        )
 
 
-@db_task()
+@signal(signals.SIGNAL_ERROR)
+def default_queue_task_error(signal, task, exc):
+    if task.name == "queue_delete_asset" and not task.retries:
+        # Out of retries. Deleting the asset again will retry from where this
+        # left off.
+        Asset.objects.filter(pk=task.kwargs["asset_id"]).update(
+            state=ASSET_STATE_DELETE_FAILED
+        )
+
+
+# Upload tasks take primary keys and staged files (see
+# icosa.helpers.file.stage_upload_files) rather than models and uploads, and
+# must be called with keyword arguments, which handle_upload_error relies on.
+
+
+@queue_on_commit_task(CONVERSIONS_QUEUE)
 def queue_upload_asset(
-    current_user: AssetOwner,
-    asset: Asset,
-    files: Optional[List[UploadedFile]] = File(None),
-) -> str:
-    upload_asset(
-        current_user,
-        asset,
-        files,
-    )
-
-
-@on_commit_task()
-def queue_upload_format(
-    current_user: AssetOwner,
-    asset: Asset,
-    files: Optional[List[UploadedFile]] = File(None),
+    user_id: int,
+    asset_id: int,
+    files: Optional[List[StagedFile]] = None,
 ):
-    upload_format(
-        current_user,
-        asset,
-        files,
-    )
+    current_user = AssetOwner.objects.get(pk=user_id)
+    asset = Asset.objects.get(pk=asset_id)
+    with open_staged_files(files) as uploaded_files:
+        upload_asset(
+            current_user,
+            asset,
+            uploaded_files,
+        )
 
 
-@on_commit_task()
+@queue_on_commit_task(UPLOADS_QUEUE)
+def queue_upload_format(
+    user_id: int,
+    asset_id: int,
+    files: Optional[List[StagedFile]] = None,
+):
+    current_user = AssetOwner.objects.get(pk=user_id)
+    asset = Asset.objects.get(pk=asset_id)
+    with open_staged_files(files) as uploaded_files:
+        upload_format(
+            current_user,
+            asset,
+            uploaded_files,
+        )
+
+
+# Finalizing relies on the asset's formats having been uploaded, so it must
+# run after the asset's queued format uploads. See HUEY_QUEUES["uploads"].
+@queue_on_commit_task(UPLOADS_QUEUE)
 def queue_finalize_asset(asset_url: str, data: AssetFinalizeData):
     asset = Asset.objects.get(url=asset_url)
 
-    # Clean up formats with no root resource.
-    # TODO(james): This can probably be done in one query
-    resources = asset.polyresource_set.filter(file="")
-    format_pks = list(set([x.format.pk for x in resources]))
-    formats = PolyFormat.objects.filter(pk__in=format_pks)
-    formats.delete()
+    with transaction.atomic():
+        # Clean up formats with no root resource.
+        asset.polyformat_set.filter(
+            pk__in=asset.polyresource_set.filter(file="").values("format_id")
+        ).delete()
 
-    # Apply triangle counts to all formats and resources.
+        # Apply triangle counts to all formats and resources.
 
-    non_tri_roles = [1, 7]  # Original OBJ, BLOCKS
+        non_tri_roles = [1, 7]  # Original OBJ, BLOCKS
 
-    non_triangulated_formats = asset.polyformat_set.filter(role__in=non_tri_roles)
-    for format in non_triangulated_formats:
-        format.triangle_count = data.objPolyCount
-        format.save()
+        asset.polyformat_set.filter(role__in=non_tri_roles).update(
+            triangle_count=data.objPolyCount
+        )
+        asset.polyformat_set.exclude(role__in=non_tri_roles).update(
+            triangle_count=data.triangulatedObjPolyCount
+        )
+        # Set-based updates don't send the signals which keep the asset's
+        # format denorms up to date.
+        update_format_denorms(asset.pk, asset)
 
-    triangulated_formats = asset.polyformat_set.exclude(role__in=non_tri_roles)
-    for format in triangulated_formats:
-        format.triangle_count = data.triangulatedObjPolyCount
-        format.save()
+        asset.remix_ids = getattr(data, "remixIds", None)
+        asset.save()
 
-    asset.remix_ids = getattr(data, "remixIds", None)
-    asset.save()
+
+# Must be called with keyword arguments, which default_queue_task_error relies
+# on.
+@on_commit_task(retries=3, retry_delay=60)
+def queue_delete_asset(asset_id: int):
+    asset = Asset.objects.filter(pk=asset_id).first()
+    if asset is None:
+        # Already deleted.
+        return
+    asset.hide_media()
+    asset.delete()
+
+
+@db_periodic_task(crontab(minute="*"))
+def queue_flush_view_counts():
+    flush_view_counts()
+
+
+@db_periodic_task(crontab(minute="0"))
+def queue_update_ranks():
+    update_ranks()
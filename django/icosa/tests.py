@@ -1,3 +1,342 @@
-from django.test import TestCase
+import tempfile
+import tracemalloc
+import zipfile
+from datetime import datetime, timezone
 
-# Create your tests here.
+from constance import config
+from icosa.api import AssetPagination, get_keyset_q, prefetch_asset_schema
+from icosa.api.schema import AssetFinalizeData, AssetSchemaOut
+from icosa.helpers.file import (
+    UPLOAD_MEMORY_BUDGET,
+    ZipLimitError,
+    check_zip_limits,
+    extract_zip,
+    upload_format,
+)
+from icosa.helpers.format_roles import (
+    GLB_FORMAT,
+    ORIGINAL_OBJ_FORMAT,
+    ORIGINAL_TRIANGULATED_OBJ_FORMAT,
+)
+from icosa.models import PUBLIC, Asset, AssetOwner, PolyFormat, PolyResource, Tag
+from icosa.tasks import queue_finalize_asset
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from ninja.files import UploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+TEST_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+    },
+}
+
+
+class PrefetchAssetSchemaTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = AssetOwner.objects.create(
+            url="owner",
+            password=b"",
+            displayname="Owner",
+        )
+        tags = [Tag.objects.create(name=name) for name in ["one", "two"]]
+        for i in range(3):
+            asset = Asset.objects.create(
+                url=f"asset{i}",
+                name=f"Asset {i}",
+                owner=owner,
+                visibility=PUBLIC,
+            )
+            asset.tags.set(tags)
+            # The last role isn't download compatible, so is left out.
+            for role in [ORIGINAL_OBJ_FORMAT, GLB_FORMAT, 4]:
+                polyformat = PolyFormat.objects.create(
+                    asset=asset,
+                    format_type=str(role),
+                    role=role,
+                )
+                for is_root in [True, False, False]:
+                    PolyResource.objects.create(
+                        asset=asset,
+                        format=polyformat,
+                        is_root=is_root,
+                        external_url=f"https://example.com/{asset.url}/{role}",
+                    )
+
+    def serialize(self, assets):
+        request = RequestFactory().get("/v1/assets")
+        results = [
+            AssetSchemaOut.model_validate(
+                asset, context={"request": request}
+            ).model_dump()
+            for asset in assets
+        ]
+        # Formats aren't fetched in any particular order.
+        for result in results:
+            result["formats"].sort(key=lambda x: x["formatType"])
+        return results
+
+    def test_query_count(self):
+        # One query each for assets and their owners, tags, formats and
+        # resources, however many assets there are.
+        assets = prefetch_asset_schema(Asset.objects.order_by("pk"))
+        with self.assertNumQueries(4):
+            results = self.serialize(assets)
+        self.assertEqual(len(results), 3)
+
+    def test_matches_unprefetched(self):
+        assets = Asset.objects.order_by("pk")
+        self.assertEqual(
+            self.serialize(prefetch_asset_schema(assets)),
+            self.serialize(assets),
+        )
+        for result in self.serialize(prefetch_asset_schema(assets)):
+            self.assertEqual(len(result["formats"]), 2)
+            for polyformat in result["formats"]:
+                self.assertIsNotNone(polyformat["root"])
+                self.assertEqual(len(polyformat["resources"]), 2)
+            self.assertEqual(result["tags"], ["one", "two"])
+
+
+class AssetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for i in range(7):
+            asset = Asset.objects.create(url=f"asset{i}", visibility=PUBLIC)
+            # Ties on the sort field, which only the id can break.
+            Asset.objects.filter(pk=asset.pk).update(
+                rank=i // 3,
+                create_time=create_time,
+            )
+
+    def page_through(self, assets):
+        pks = []
+        params = {"pageSize": "2"}
+        for _ in range(10):
+            page = AssetPagination().paginate_queryset(
+                assets,
+                AssetPagination.Input(**params),
+                request=None,
+            )
+            pks += [asset.pk for asset in page["assets"]]
+            if "nextPageToken" not in page:
+                break
+            params["pageToken"] = page["nextPageToken"]
+        return pks
+
+    def test_pages_through_ties(self):
+        for ordering in [("-rank", "-id"), ("create_time", "id")]:
+            assets = Asset.objects.order_by(*ordering)
+            self.assertEqual(
+                self.page_through(assets),
+                list(assets.values_list("pk", flat=True)),
+            )
+
+    def test_keyset_q_is_bounded(self):
+        # A range on the sort field lets Postgres seek the index to the
+        # cursor, rather than filter every earlier row.
+        cursor = {"ordering": "-rank", "value": 1.0, "pk": 3}
+        assets = Asset.objects.filter(get_keyset_q(("-rank", "-id"), cursor))
+        self.assertIn('"assets"."rank" <= 1.0', str(assets.query))
+
+
+class UploadFormatTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = AssetOwner.objects.create(
+            url="owner",
+            password=b"",
+            displayname="Owner",
+        )
+        cls.asset = Asset.objects.create(url="asset", owner=cls.owner)
+        # Reading a setting for the first time stores its default, which
+        # would otherwise be counted below.
+        config.EXTERNAL_MEDIA_CORS_ALLOW_LIST
+
+    def setUp(self):
+        self.enterContext(self.settings(STORAGES=TEST_STORAGES))
+
+    def upload(self, name, content=b"content"):
+        upload_format(self.owner, self.asset, [SimpleUploadedFile(name, content)])
+
+    def test_mtl_query_count(self):
+        # An MTL adds both OBJ formats, their roots and a copy of itself for
+        # each: two formats and four resources, saved with one insert each.
+        with self.assertNumQueries(12):
+            self.upload("model.mtl")
+        self.assertEqual(self.asset.polyformat_set.count(), 2)
+        self.assertEqual(self.asset.polyresource_set.count(), 4)
+
+    def test_finalize_query_count(self):
+        self.upload("model.mtl")
+        self.upload("model.obj")
+        self.upload("model-triangulated.obj")
+        data = AssetFinalizeData(objPolyCount=10, triangulatedObjPolyCount=20)
+        # Triangle counts are set with one update per group of roles,
+        # however many formats there are.
+        with self.assertNumQueries(12):
+            queue_finalize_asset.call_local(self.asset.url, data)
+        self.assertEqual(
+            dict(self.asset.polyformat_set.values_list("role", "triangle_count")),
+            {ORIGINAL_OBJ_FORMAT: 10, ORIGINAL_TRIANGULATED_OBJ_FORMAT: 20},
+        )
+
+
+class AssetViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = AssetOwner.objects.create(
+            url="owner",
+            password=b"",
+            displayname="Owner",
+        )
+        for i in range(3):
+            asset = Asset.objects.create(
+                url=f"asset{i}",
+                name=f"Asset {i}",
+                owner=owner,
+                visibility=PUBLIC,
+                curated=True,
+                license="CREATIVE_COMMONS_BY_4_0",
+            )
+            for role in [ORIGINAL_OBJ_FORMAT, GLB_FORMAT]:
+                polyformat = PolyFormat.objects.create(
+                    asset=asset,
+                    format_type="GLB" if role == GLB_FORMAT else "OBJ",
+                    role=role,
+                )
+                for is_root in [True, False]:
+                    PolyResource.objects.create(
+                        asset=asset,
+                        format=polyformat,
+                        is_root=is_root,
+                        external_url=f"https://example.com/{asset.url}/{role}",
+                    )
+        # Reading a setting for the first time stores its default, which
+        # would otherwise be counted below.
+        config.EXTERNAL_MEDIA_CORS_ALLOW_LIST
+        config.BETA_MODE
+
+    def test_asset_view_query_count(self):
+        # The asset with its root resources, the view count, then each of its
+        # resources, downloadable formats and their resources in one query.
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse("asset_view", args=["asset0"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(response.context["downloadable_formats"]),
+            {
+                "GLB File": {"file": "https://example.com/asset0/18"},
+                "OBJ File": {"file": "https://example.com/asset0/1"},
+            },
+        )
+
+    def test_listing_query_count(self):
+        # The heroes, the count, and one query for the page of assets.
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["assets"]), 3)
+
+
+class AssetEtagTest(TestCase):
+    def test_ownerless_asset(self):
+        Asset.objects.create(url="asset", visibility=PUBLIC)
+        response = self.client.get(f"{reverse('api-1.0.0:asset_list')}/asset")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("ETag"))
+
+    def test_owner_rename(self):
+        owner = AssetOwner.objects.create(
+            url="owner",
+            password=b"",
+            displayname="Old",
+        )
+        Asset.objects.create(
+            url="asset",
+            owner=owner,
+            visibility=PUBLIC,
+            license="CREATIVE_COMMONS_BY_4_0",
+        )
+        asset_url = f"{reverse('api-1.0.0:asset_list')}/asset"
+        list_url = reverse("api-1.0.0:asset_list")
+        response = self.client.get(asset_url)
+        etag = response["ETag"]
+        self.assertEqual(response.json()["authorName"], "Old")
+        assets = self.client.get(list_url).json()["assets"]
+        self.assertEqual(assets[0]["authorName"], "Old")
+
+        # Cached responses must not outlive the rename.
+        owner = AssetOwner.objects.get(pk=owner.pk)
+        owner.displayname = "New"
+        owner.save()
+        response = self.client.get(asset_url)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["authorName"], "New")
+        assets = self.client.get(list_url).json()["assets"]
+        self.assertEqual(assets[0]["authorName"], "New")
+
+
+class ExtractZipTest(SimpleTestCase):
+    def make_zip(self, members):
+        """Writes a zip of `members`, a dict of name to (chunk, repeat), a
+        chunk at a time, and returns it opened as an upload."""
+        path = self.enterContext(tempfile.NamedTemporaryFile(suffix=".zip")).name
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for name, (chunk, repeat) in members.items():
+                with zip_file.open(name, "w", force_zip64=True) as member:
+                    for _ in range(repeat):
+                        member.write(chunk)
+        file = self.enterContext(open(path, "rb"))
+        return UploadedFile(name="upload.zip", file=file)
+
+    def get_peak_memory(self, file):
+        tracemalloc.start()
+        try:
+            extracted = extract_zip(file)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        for x in extracted:
+            x.close()
+        return extracted, peak
+
+    def test_large_member_memory(self):
+        # 1 GiB of zeros compresses to about 1 MiB.
+        chunk = bytes(1024 * 1024)
+        file = self.make_zip({"model.glb": (chunk, 1024)})
+        extracted, peak = self.get_peak_memory(file)
+        self.assertEqual(extracted[0].size, 1024 * len(chunk))
+        self.assertLess(peak, 8 * 1024 * 1024)
+
+    def test_many_members_memory(self):
+        # Members which fit in memory are only kept there up to a budget.
+        chunk = bytes(256 * 1024)
+        file = self.make_zip({f"{i}.png": (chunk, 1) for i in range(500)})
+        extracted, peak = self.get_peak_memory(file)
+        self.assertEqual(len(extracted), 500)
+        self.assertLess(peak, UPLOAD_MEMORY_BUDGET)
+
+    def test_too_many_members(self):
+        file = self.make_zip({f"{i}.png": (b"x", 1) for i in range(3)})
+        with self.settings(UPLOAD_MAX_ZIP_MEMBERS=2):
+            with self.assertRaises(ZipLimitError):
+                check_zip_limits(file)
+            with self.assertRaises(ZipLimitError):
+                extract_zip(file)
+
+    def test_too_large(self):
+        file = self.make_zip({"model.glb": (bytes(1024), 2)})
+        with self.settings(UPLOAD_MAX_UNCOMPRESSED_SIZE=2047):
+            with self.assertRaises(ZipLimitError):
+                check_zip_limits(file)
+            with self.assertRaises(ZipLimitError):
+                extract_zip(file)
+        with self.settings(UPLOAD_MAX_UNCOMPRESSED_SIZE=2048):
+            check_zip_limits(file)
+            for x in extract_zip(file):
+                x.close()
@@ -1,49 +1,131 @@
+import hashlib
 from functools import wraps
+from urllib.parse import urlencode
 
 from icosa.api import get_django_user_from_auth_bearer
+from icosa.helpers.cache import (
+    get_generations,
+    normalize_param_name,
+    record_cache_result,
+)
 
 from django.core.cache import cache as core_cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_http_date_safe, quote_etag
 
 
-def cache_key(request):
-
+def get_cache_user_id(request):
     if request.user.is_anonymous:
         user = get_django_user_from_auth_bearer(request)
         if user is None:
-            user_id = "anonymous"
-        else:
-            user_id = user.id
-    else:
-        user_id = request.user.id
+            return "anonymous"
+        return user.id
+    return request.user.id
+
 
+def normalize_query(request):
+    # Parameter order and naming style don't change the response, so they
+    # shouldn't change the cache key either.
     q = getattr(request, request.method)
-    # q.lists()
-    urlencode = q.urlencode(safe="()")
+    params = sorted(
+        (normalize_param_name(name), sorted(values)) for name, values in q.lists()
+    )
+    return urlencode([(name, value) for name, values in params for value in values])
+
+
+def cache_key(request, per_user=True, generations=None):
+    user_id = get_cache_user_id(request) if per_user else "all"
+    query = normalize_query(request)
+    if generations:
+        query += "_" + "_".join([str(x) for x in get_generations(generations)])
+    query_hash = hashlib.md5(query.encode()).hexdigest()
 
-    CACHE_KEY = f"view_cache_{request.path}_{user_id}_{urlencode}"
+    CACHE_KEY = f"view_cache_{request.path}_{user_id}_{query_hash}"
     return CACHE_KEY
 
 
-def cache_per_user(ttl=None, prefix=None):
+# Validators kept alongside a cached response, so that hits can answer
+# conditional requests.
+CACHED_HEADERS = ["ETag", "Last-Modified"]
+
+
+def get_cached_response(request, cache_key):
+    cached = core_cache.get(cache_key, None)
+    if cached is None:
+        return None
+    status, content_type, content, headers = cached
+    response = HttpResponse(content, status=status, content_type=content_type)
+    for header, value in headers.items():
+        response[header] = value
+    return get_conditional_response(
+        request,
+        etag=headers.get("ETag"),
+        last_modified=parse_http_date_safe(headers.get("Last-Modified")),
+        response=response,
+    )
+
+
+def set_cached_response(cache_key, response, ttl):
+    """Stores a response's rendered bytes rather than the response object, so
+    that a hit costs a single unpickle of a tuple of strings."""
+    if not response.has_header("ETag"):
+        response["ETag"] = quote_etag(hashlib.md5(response.content).hexdigest())
+    cached = (
+        response.status_code,
+        response["Content-Type"],
+        response.content,
+        {
+            header: response[header]
+            for header in CACHED_HEADERS
+            if response.has_header(header)
+        },
+    )
+    core_cache.set(cache_key, cached, ttl)
+
+
+def cache_per_user(ttl=None, prefix=None, generations=None, per_user=True):
+    """Caches a view's rendered response per user, or for everyone if
+    `per_user` is False.
+
+    `generations` is a callable taking the view's arguments and returning the
+    names of generation counters (see icosa.helpers.cache) that the response
+    depends on. Bumping any of them invalidates the cached response.
+    """
+
     def decorator(view_function):
         @wraps(view_function)
         def apply_cache(request, *args, **kwargs):
-            CACHE_KEY = cache_key(request)
-
-            if prefix:
-                CACHE_KEY = f"{prefix}_{CACHE_KEY}"
-
             can_cache = request.method in ["GET", "HEAD", "OPTIONS"]
 
             if can_cache:
-                response = core_cache.get(CACHE_KEY, None)
+                CACHE_KEY = cache_key(
+                    request,
+                    per_user=per_user,
+                    generations=(
+                        generations(request, *args, **kwargs) if generations else None
+                    ),
+                )
+                if prefix:
+                    CACHE_KEY = f"{prefix}_{CACHE_KEY}"
+                response = get_cached_response(request, CACHE_KEY)
+                record_cache_result(response is not None)
             else:
                 response = None
 
-            if not response:
+            if response is None:
                 response = view_function(request, *args, **kwargs)
-                if can_cache:
-                    core_cache.set(CACHE_KEY, response, ttl)
+                if not can_cache:
+                    return response
+                # Errors may be transient, so only successes are kept.
+                if not response.streaming and response.status_code == 200:
+                    set_cached_response(CACHE_KEY, response, ttl)
+                response["X-Cache"] = "MISS"
+            else:
+                response["X-Cache"] = "HIT"
+            # We invalidate entries here when assets change, but the site-wide
+            # cache middleware can't know to, so keep it out.
+            patch_cache_control(response, max_age=0)
             return response
 
         return apply_cache
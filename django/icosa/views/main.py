@@ -25,6 +25,7 @@ from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.views.decorators.cache import never_cache
 from honeypot.decorators import check_honeypot
+from icosa.api.filters import LISTED_Q, query_assets
 from icosa.forms import (
     ARTIST_QUERY_SUBJECT_CHOICES,
     ArtistQueryForm,
@@ -34,21 +35,32 @@ from icosa.forms import (
     UserSettingsForm,
 )
 from icosa.helpers.email import spawn_send_html_mail
-from icosa.helpers.file import b64_to_img, upload_asset
+from icosa.helpers.file import (
+    ZipLimitError,
+    b64_to_img,
+    check_upload_limits,
+    stage_upload_files,
+    upload_asset,
+)
+from icosa.helpers.search import get_search_backend
 from icosa.helpers.snowflake import generate_snowflake
+from icosa.helpers.view_counts import record_asset_view
 from icosa.models import (
     ALL_RIGHTS_RESERVED,
     ASSET_STATE_BARE,
+    ASSET_STATE_DELETING,
     ASSET_STATE_UPLOADING,
     CATEGORY_LABELS,
+    LISTING_DEFERRED_FIELDS,
     PRIVATE,
     PUBLIC,
     UNLISTED,
     Asset,
     AssetOwner,
     MastheadSection,
+    root_resources_prefetch,
 )
-from icosa.tasks import queue_upload_asset
+from icosa.tasks import queue_delete_asset, queue_upload_asset
 
 POLY_USER_URL = "4aEd8rQgKu2"
 
@@ -92,11 +104,9 @@ def div_by_zero(request):
 
 def landing_page(
     request,
-    assets=Asset.objects.filter(
-        visibility=PUBLIC,
+    q=Q(
         is_viewer_compatible=True,
         curated=True,
-        last_reported_time__isnull=True,
     ),
     show_hero=True,
     heading=None,
@@ -115,9 +125,9 @@ def landing_page(
 
     # TODO(james): filter out assets with no formats
     assets = (
-        assets.exclude(license__isnull=True)
-        .exclude(license=ALL_RIGHTS_RESERVED)
+        query_assets(LISTED_Q & q, order_by="BEST")
         .select_related("owner")
+        .defer(*LISTING_DEFERRED_FIELDS)
     )
 
     try:
@@ -152,7 +162,7 @@ def landing_page(
     if hero is not None and not hero.visibility == PUBLIC:
         hero = None
 
-    paginator = Paginator(assets.order_by("-rank"), settings.PAGINATION_PER_PAGE)
+    paginator = Paginator(assets, settings.PAGINATION_PER_PAGE)
     assets = paginator.get_page(page_number)
     page_title = f"Exploring {heading}" if is_explore_heading else heading
     context = {
@@ -178,15 +188,14 @@ def home(request):
 
 @never_cache
 def home_openbrush(request):
-    assets = Asset.objects.filter(
-        visibility=PUBLIC,
+    q = Q(
         has_tilt=True,
         curated=True,
     )
 
     return landing_page(
         request,
-        assets,
+        q,
         heading="Open Brush",
         heading_link="https://openbrush.app",
         is_explore_heading=True,
@@ -196,15 +205,13 @@ def home_openbrush(request):
 
 @never_cache
 def home_blocks(request):
-    poly_by_google_q = Q(visibility=PUBLIC, owner__url=POLY_USER_URL)
-    blocks_q = Q(visibility=PUBLIC, has_blocks=True, curated=True)
+    poly_by_google_q = Q(owner__url=POLY_USER_URL)
+    blocks_q = Q(has_blocks=True, curated=True)
     q = poly_by_google_q | blocks_q
 
-    assets = Asset.objects.filter(q)
-
     return landing_page(
         request,
-        assets,
+        q,
         heading="Open Blocks",
         heading_link="https://openblocks.app",
         is_explore_heading=True,
@@ -218,7 +225,6 @@ def home_other(request):
     home_q = Q(
         is_viewer_compatible=True,
         curated=True,
-        last_reported_time__isnull=True,
     )
     poly_by_google_q = Q(owner__url=POLY_USER_URL)
     only_blocks_q = Q(has_blocks=True, curated=True)
@@ -228,11 +234,10 @@ def home_other(request):
         curated=True,
     )
     exclude_q = home_q | blocks_q | tilt_q
-    assets = Asset.objects.filter(visibility=PUBLIC).exclude(exclude_q)
 
     return landing_page(
         request,
-        assets,
+        ~exclude_q,
         show_hero=True,
         heading="""stuff not on /blocks or /openbrush""",
     )
@@ -242,15 +247,14 @@ def category(request, category):
     category_label = category.upper()
     if category_label not in CATEGORY_LABELS:
         raise Http404()
-    assets = Asset.objects.filter(
-        visibility=PUBLIC,
+    q = Q(
         category=category_label,
         curated=True,
     )
     category_name = settings.ASSET_CATEGORY_LABEL_MAP.get(category)
     return landing_page(
         request,
-        assets,
+        q,
         show_hero=False,
         heading=f"Exploring: {category_name}",
     )
@@ -264,6 +268,11 @@ def uploads(request):
     user = AssetOwner.from_django_request(request)
     if request.method == "POST":
         form = AssetUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                check_upload_limits([request.FILES["file"]])
+            except ZipLimitError as err:
+                form.add_error("file", f"{err}")
         if form.is_valid():
             job_snowflake = generate_snowflake()
             asset_token = secrets.token_urlsafe(8)
@@ -275,9 +284,9 @@ def uploads(request):
             )
             if getattr(settings, "ENABLE_TASK_QUEUE", True) is True:
                 queue_upload_asset(
-                    current_user=user,
-                    asset=asset,
-                    files=[request.FILES["file"]],
+                    user_id=user.pk,
+                    asset_id=asset.pk,
+                    files=stage_upload_files([request.FILES["file"]]),
                 )
             else:
                 upload_asset(
@@ -295,6 +304,8 @@ def uploads(request):
     asset_objs = (
         Asset.objects.filter(owner=user)
         .exclude(state=ASSET_STATE_BARE)
+        .exclude(state=ASSET_STATE_DELETING)
+        .defer(*LISTING_DEFERRED_FIELDS)
         .order_by("-create_time")
     )
     paginator = Paginator(asset_objs, settings.PAGINATION_PER_PAGE)
@@ -325,10 +336,14 @@ def user_show(request, user_url):
         url=user_url,
     )
 
-    asset_objs = Asset.objects.filter(
-        owner=owner,
-        visibility=PUBLIC,
-    ).order_by("-id")
+    asset_objs = (
+        Asset.objects.filter(
+            owner=owner,
+            visibility=PUBLIC,
+        )
+        .defer(*LISTING_DEFERRED_FIELDS)
+        .order_by("-id")
+    )
     paginator = Paginator(asset_objs, settings.PAGINATION_PER_PAGE)
     page_number = request.GET.get("page")
     assets = paginator.get_page(page_number)
@@ -352,7 +367,11 @@ def my_likes(request):
     q = Q(visibility__in=[PUBLIC, UNLISTED])
     q |= Q(visibility__in=[PRIVATE, UNLISTED], owner=owner)
 
-    asset_objs = owner.likes.filter(q)
+    asset_objs = (
+        owner.likes.filter(q)
+        .select_related("owner")
+        .defer(*LISTING_DEFERRED_FIELDS)
+    )
     paginator = Paginator(asset_objs, settings.PAGINATION_PER_PAGE)
     page_number = request.GET.get("page")
     assets = paginator.get_page(page_number)
@@ -373,9 +392,14 @@ def my_likes(request):
 def asset_view(request, asset_url):
     template = "main/asset_view.html"
 
-    asset = get_object_or_404(Asset, url=asset_url)
+    asset = get_object_or_404(
+        Asset.objects.select_related("owner").prefetch_related(
+            root_resources_prefetch()
+        ),
+        url=asset_url,
+    )
     check_user_can_view_asset(request.user, asset)
-    asset.inc_views_and_rank()
+    record_asset_view(asset.pk)
     override_suffix = request.GET.get("nosuffix", "")
     format_override = request.GET.get("forceformat", "")
 
@@ -486,7 +510,11 @@ def asset_status(request, asset_url):
 def edit_asset(request, asset_url):
     template = "main/edit_asset.html"
     owner = AssetOwner.from_django_user(request.user)
-    asset = get_object_or_404(Asset, owner=owner, url=asset_url)
+    asset = get_object_or_404(
+        Asset.objects.prefetch_related(root_resources_prefetch()),
+        owner=owner,
+        url=asset_url,
+    )
     if request.method == "GET":
         form = AssetSettingsForm(instance=asset)
     elif request.method == "POST":
@@ -518,8 +546,12 @@ def delete_asset(request, asset_url):
         else:
             asset_name = "Unnamed asset"
 
-        asset.hide_media()
-        asset.delete()
+        asset.mark_for_deletion()
+        if getattr(settings, "ENABLE_TASK_QUEUE", True) is True:
+            queue_delete_asset(asset_id=asset.pk)
+        else:
+            asset.hide_media()
+            asset.delete()
         messages.add_message(
             request,
             messages.INFO,
@@ -730,21 +762,15 @@ def search(request):
     query = request.GET.get("s")
     template = "main/search.html"
 
-    q = Q(
-        visibility=PUBLIC,
-        is_viewer_compatible=True,
-        last_reported_time__isnull=True,
-    )
-
-    if query is not None:
-        q &= Q(search_text__icontains=query)
+    q = LISTED_Q & Q(is_viewer_compatible=True)
 
     asset_objs = (
-        Asset.objects.filter(q)
-        .exclude(license__isnull=True)
-        .exclude(license=ALL_RIGHTS_RESERVED)
-        .order_by("-rank")
+        query_assets(q, order_by="BEST")
+        .select_related("owner")
+        .defer(*LISTING_DEFERRED_FIELDS)
     )
+    if query is not None:
+        asset_objs = get_search_backend().search(asset_objs, query)
     paginator = Paginator(asset_objs, settings.PAGINATION_PER_PAGE)
     page_number = request.GET.get("page")
     assets = paginator.get_page(page_number)